@@ -1,20 +1,106 @@
 import logging
 
 from aiomisc import entrypoint
+from aiomisc.log import basic_config
+from aiomisc.utils import bind_socket
 
 from app import models
 from app.dependency import config_dependency
-from app.services import BotService, BotSubscriptionService
+from app.ruz.server import load_week
+from app.services import (
+    BotService,
+    BotSubscriptionService,
+    CacheSnapshotService,
+    CallbackBotService,
+    RuzDirectoryService,
+    ScheduleWarmupService,
+)
+from app.supervisor import Supervisor
 
 log = logging.getLogger(__name__)
 
 
 def start_app(config: dict):
+    if config["bot_mode"] not in ("longpoll", "callback"):
+        raise ValueError(f"Unknown bot mode {config['bot_mode']!r}")
+    if config["bot_mode"] == "callback" and not (
+        config["vk_secret"] and config["vk_confirmation"]
+    ):
+        # Без секрета любой может прислать событие от имени пользователя
+        raise ValueError("Callback mode requires VK_SECRET and VK_CONFIRMATION")
+    if config["ruz_warmup_interval"] >= load_week.cache.ttl:
+        # Иначе популярные недели успевают истечь между прогревами
+        raise ValueError(
+            f"RUZ_WARMUP_INTERVAL must be less than {load_week.cache.ttl:.0f} s"
+        )
+    if config["bot_processes"] <= 1:
+        run_worker(config)
+        return
+    # Longpoll сервер у группы один, его нельзя читать из нескольких процессов
+    if config["bot_mode"] != "callback":
+        raise ValueError("Several bot processes require callback mode")
+    basic_config(level=logging.DEBUG if config["debug"] else logging.INFO)
+    Supervisor(
+        lambda index: run_worker(config, index), config["bot_processes"]
+    ).run()
+
+
+def run_worker(config: dict, index: int = 0):
+    """
+    Запускает все сервисы бота в текущем процессе
+
+    :param index: номер процесса, рассылка и сохранение кэша только в процессе 0
+    """
     config_dependency(config)
+    processes = max(config["bot_processes"], 1)
+    bot_config = dict(
+        token=config["vk_token"],
+        group_id=config["vk_group_id"],
+        workers=config["bot_workers"],
+        queue_size=config["bot_queue_size"],
+        stats_interval=config["bot_stats_interval"],
+        drain_timeout=config["bot_drain_timeout"],
+        answer_unread=index == 0,
+    )
+    if config["bot_mode"] == "callback":
+        bot_service = CallbackBotService(
+            # Каждый процесс слушает свой сокет на том же порту,
+            # соединения между ними распределяет ядро
+            sock=bind_socket(
+                address=config["callback_host"],
+                port=config["callback_port"],
+                reuse_port=True,
+                proto_name="http",
+            ),
+            path=config["callback_path"],
+            confirmation=config["vk_confirmation"],
+            secret=config["vk_secret"],
+            **bot_config,
+        )
+    else:
+        bot_service = BotService(**bot_config)
+    services = [
+        bot_service,
+        RuzDirectoryService(interval=config["ruz_directory_interval"]),
+        # Кэш у каждого процесса свой, поэтому каждый прогревает популярные
+        # расписания с тем же интервалом (меньше ttl недели), сдвиг только
+        # разносит запросы процессов к порталу по времени
+        ScheduleWarmupService(
+            interval=config["ruz_warmup_interval"],
+            delay=config["ruz_warmup_interval"] * index / processes,
+            size=config["ruz_warmup_size"],
+        ),
+        CacheSnapshotService(
+            interval=config["ruz_cache_snapshot_interval"],
+            delay=config["ruz_cache_snapshot_interval"],
+            path=config["ruz_cache_path"],
+            save=index == 0,
+        ),
+    ]
+    if index == 0:
+        services.append(BotSubscriptionService(token=config["vk_token"]))
     with entrypoint(
-        BotService(token=config["vk_token"], group_id=config["vk_group_id"]),
-        BotSubscriptionService(token=config["vk_token"]),
-        log_level=logging.DEBUG if config["debug"] else logging.INFO,
+        *services, log_level=logging.DEBUG if config["debug"] else logging.INFO,
     ) as loop:
-        log.info("Bot started")
+        log.info("Bot started in process %s", index)
         loop.run_forever()
@@ -0,0 +1,29 @@
+"""Short links
+
+Revision ID: 5d2b7e8f1a3c
+Revises: 67c1128ba667
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5d2b7e8f1a3c"
+down_revision = "67c1128ba667"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "short_links",
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("url", sa.Text(), nullable=False),
+        sa.Column("short_url", sa.String(length=256), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+
+
+def downgrade():
+    op.drop_table("short_links")
@@ -3,7 +3,6 @@ import datetime
 import random
 import logging
 from asyncio import AbstractEventLoop
-from re import match
 from urllib.parse import urlencode
 
 import ujson
@@ -11,28 +10,26 @@ from aiovk import API
 from aiovk.sessions import BaseSession
 from pymysql import OperationalError
 
-from app.longpoll import BotsLongPoll
+from app.links import LinkShortener
+from app.dispatcher import MessageQueue
+from app.longpoll import BotsLongPoll, Message
 from app.dependency import connection
 from app.models import User, UserProxy
 import app.utils.constants as const
-from app.ruz.server import format_schedule, get_group, get_teacher
+from app.ruz.client import RuzClient
+from app.ruz.server import (
+    format_schedule,
+    get_group,
+    get_teacher,
+    iter_schedule,
+    semester_end,
+)
 from app.utils import strings
 import app.utils.keyboards as keyboards
 
 log = logging.getLogger(__name__)
 
 
-class BotResponse(dict):
-    def __init__(self, **kwargs):
-        super().__init__(kwargs)
-
-    def __getattr__(self, item):
-        return self[item]
-
-    def __repr__(self):
-        return f'BotResponse "{self}"'
-
-
 def get_random_id():
     """ Get random int32 number (signed) """
     return random.getrandbits(31) * random.choice([-1, 1])
@@ -45,32 +42,44 @@ class Bot:
         group_id: str = None,
         loop: AbstractEventLoop = None,
         db: connection = None,
+        ruz: RuzClient = None,
         mode=4096,
         without_longpool=False,
+        callback=False,
+        workers: int = 20,
+        queue_size: int = 1000,
     ):
+        """
+        :param without_longpool: бот только отправляет сообщения (рассылка)
+        :param callback: сообщения приходят через Callback API, а не longpoll
+        """
         if db is None and not without_longpool:
             raise RuntimeError("DB must be set")
+        if ruz is None:
+            raise RuntimeError("RUZ client must be set")
         self.vk = API(session)
         if not without_longpool:
-            self.longpool = BotsLongPoll(session, group_id=group_id)
+            self.longpool = (
+                None if callback else BotsLongPoll(session, group_id=group_id)
+            )
+            self.queue = MessageQueue(self.handle_new_message, workers, queue_size)
         else:
             self.longpool = None
+            self.queue = None
         self.loop = loop or asyncio.get_running_loop()
         self.db = db
+        self.ruz = ruz
+        self.links = LinkShortener(self.vk, db)
 
     @classmethod
     def without_longpool(
-        cls, session: BaseSession, loop: AbstractEventLoop = None, db: connection = None
+        cls,
+        session: BaseSession,
+        loop: AbstractEventLoop = None,
+        db: connection = None,
+        ruz: RuzClient = None,
     ):
-        return cls(session, loop=loop, without_longpool=True, db=db)
-
-    @staticmethod
-    def parse_resp(resp):
-        return (
-            BotResponse(**update["object"])
-            for update in resp["updates"]
-            if update["type"] == "message_new"
-        )
+        return cls(session, loop=loop, without_longpool=True, db=db, ruz=ruz)
 
     async def update_user(self, user_id, data: dict):
         async with self.db() as conn:
@@ -79,11 +88,11 @@ class Bot:
     async def main_loop(self):
         if self.longpool is None:
             raise NotImplementedError()
-        for event in self.parse_resp(await self.longpool.wait()):
+        for event in await self.longpool.wait_messages():
             log.debug('User %s with message "%s"', event.peer_id, event.text)
-            self.loop.create_task(self.handle_new_message(event))
+            await self.queue.put(event)
 
-    async def handle_new_message(self, msg: BotResponse):
+    async def handle_new_message(self, msg: Message):
         try:
             async with self.db() as conn:
                 user = await (
@@ -100,7 +109,7 @@ class Bot:
                 "У нас что-то пошло не по плану, попробуй написать позже...",
             )
         log.debug("New %r", user)
-        payload = ujson.loads(msg.payload if "payload" in msg else "{}")
+        payload = ujson.loads(msg.payload or "{}")
         message = msg.text.lower()
 
         if (
@@ -168,16 +177,6 @@ class Bot:
                     ),
                 )
 
-    async def get_short_link(self, url: str):
-        url = url.strip()
-        if not match(r"(https?://)([\da-z.-]+)\.([a-z.]{2,6})([/\w.-]*)*/?", url):
-            return url
-        vk_link = match(r"^(https?://)?vk\.com/([\w.-]+)+$", url)
-        if vk_link:
-            return "@" + vk_link.groups()[1]
-        link = await self.vk.utils.getShortLink(url=url)
-        return link["short_url"]
-
     async def vk_bot_answer_unread(self):
         unread = await self.vk.messages.getConversations(filter="unread", count=100)
         log.info("Answering %s unread messages", unread.get("unread_count", 0))
@@ -262,6 +261,7 @@ class Bot:
         elif start_day == -2 and inline_keyboard_date is None:
             start_day = 7 - datetime.datetime.now().isoweekday() + 1
         schedule = await format_schedule(
+            self.ruz,
             user.current_id,
             user.role,
             start_day=start_day,
@@ -269,7 +269,7 @@ class Bot:
             text=text,
             show_groups=user.show_groups,
             show_location=user.show_location,
-            link_formatter=self.get_short_link,
+            link_formatter=self.links.shorten,
         )
         if schedule is None:
             log.warning(
@@ -286,6 +286,48 @@ class Bot:
         )
         return user
 
+    async def send_long_schedule(
+        self, user: UserProxy, payload: dict = None
+    ) -> UserProxy or None:
+        """
+        Отсылает пользователю расписание на месяц или до конца семестра,
+        по сообщению на неделю
+
+        :param user:
+        :param payload: const.PAYLOAD_PERIOD - const.PERIOD_MONTH или PERIOD_SEMESTER
+        :return:
+        """
+        period = (payload or {}).get(const.PAYLOAD_PERIOD, const.PERIOD_MONTH)
+        today = datetime.date.today()
+        if period == const.PERIOD_SEMESTER:
+            days = (semester_end(today) - today).days + 1
+        else:
+            days = 30
+        weeks = iter_schedule(
+            self.ruz,
+            user.current_id,
+            user.role,
+            days=days,
+            show_groups=user.show_groups,
+            show_location=user.show_location,
+            link_formatter=self.links.shorten,
+            layout="compact",
+        )
+        try:
+            async for schedule in weeks:
+                if schedule is None:
+                    log.warning(
+                        "Error getting long schedule: user %s for %s",
+                        user.id,
+                        user.current_name,
+                    )
+                    await self.send_msg(user.id, strings.CANT_GET_SCHEDULE)
+                    return None
+                await self.send_msg(user.id, schedule)
+        finally:
+            await weeks.aclose()
+        return user
+
     async def send_one_day_schedule(
         self, user: UserProxy, payload: dict = None
     ) -> UserProxy:
@@ -325,12 +367,13 @@ class Bot:
             return user
         start_day = (date - datetime.datetime.today() + datetime.timedelta(days=1)).days
         schedule = await format_schedule(
+            self.ruz,
             user.current_id,
             user.role,
             start_day=start_day,
             show_location=user.show_location,
             show_groups=user.show_groups,
-            link_formatter=self.get_short_link,
+            link_formatter=self.links.shorten,
         )
         if schedule is None:
             await self.send_msg(
@@ -367,7 +410,7 @@ class Bot:
         """
 
         group_name = group_name.strip().replace(" ", "").upper()
-        group = await get_group(group_name)
+        group = await get_group(self.ruz, group_name)
         if group.has_error is False:
             await self.update_user(
                 user.id,
@@ -394,7 +437,8 @@ class Bot:
             elif group.error_text == "Not found":
                 await self.send_msg(
                     user.id,
-                    strings.GROUP_NOT_FOUND.format(group_name),
+                    strings.GROUP_NOT_FOUND.format(group_name)
+                    + self.group_suggestions(group.data),
                     keyboards.back_to_choosing_role(),
                 )
                 return user
@@ -405,6 +449,12 @@ class Bot:
                     group_name,
                 )
 
+    @staticmethod
+    def group_suggestions(suggestions: list) -> str:
+        if not suggestions:
+            return ""
+        return "\n\n" + strings.MAYBE_GROUP.format(", ".join(suggestions))
+
     async def search_check_group(
         self, user: UserProxy, group_name: str
     ) -> None or UserProxy:
@@ -417,7 +467,7 @@ class Bot:
         """
 
         group_name = group_name.strip().replace(" ", "").upper()
-        group = await get_group(group_name)
+        group = await get_group(self.ruz, group_name)
         if group.has_error is False:
             await self.update_user(
                 user.id, data=dict(found_name=group_name, found_id=group.data)
@@ -438,7 +488,8 @@ class Bot:
             elif group.error_text == "Not found":
                 await self.send_msg(
                     user.id,
-                    strings.GROUP_NOT_FOUND.format(group_name),
+                    strings.GROUP_NOT_FOUND.format(group_name)
+                    + self.group_suggestions(group.data),
                     keyboards.schedule_menu(user),
                 )
                 return user
@@ -491,7 +542,7 @@ class Bot:
         await self.send_msg(
             user.id, strings.SEARCHING_FOR_TEACHER,
         )
-        teachers = await get_teacher(teacher_name)
+        teachers = await get_teacher(self.ruz, teacher_name)
         if teachers.has_error:
             log.warning(
                 "Error getting schedule: user %s for %s", user.id, user.current_name
@@ -537,7 +588,7 @@ class Bot:
         #     random_id=get_random_id(),
         #     message=strings.SEARCHING,
         # )
-        teachers = await get_teacher(teacher_name)
+        teachers = await get_teacher(self.ruz, teacher_name)
         if teachers.has_error:
             log.warning("Error getting schedule: user %s for %s", user.id, teacher_name)
             await self.send_msg(
@@ -627,13 +678,14 @@ class Bot:
         elif start_day == -2:
             start_day = 7 - datetime.datetime.now().isoweekday() + 1
         schedule = await format_schedule(
+            self.ruz,
             user.found_id,
             type=user.found_type,
             start_day=start_day,
             days=days,
             show_groups=True,
             show_location=True,
-            link_formatter=self.get_short_link,
+            link_formatter=self.links.shorten,
         )
         await self.update_user(
             user.id, data=dict(found_id=None, found_name=None, found_type=None)
@@ -3,6 +3,9 @@ from typing import AsyncContextManager, Callable
 from aiomysql.sa import create_engine, SAConnection
 from aiomisc_dependency import dependency
 
+from app.ruz.cache import set_stale_window
+from app.ruz.client import RuzClient
+
 connection = Callable[[], AsyncContextManager[SAConnection]]
 
 
@@ -10,7 +13,7 @@ def config_dependency(config):
     @dependency
     async def db_write() -> connection:
         engine = await create_engine(
-            maxsize=50,
+            maxsize=config["db_pool_size"],
             pool_recycle=config["db_connect_timeout"],
             host=config["db_host"],
             user=config["db_user"],
@@ -24,3 +27,20 @@ def config_dependency(config):
         yield engine.acquire
         engine.close()
         await engine.wait_closed()
+
+    @dependency
+    async def ruz_client() -> RuzClient:
+        client = RuzClient(
+            limit_per_host=config["ruz_limit_per_host"],
+            dns_ttl=config["ruz_dns_ttl"],
+            max_timeout=config["ruz_max_timeout"],
+            hedge_ratio=config["ruz_hedge_ratio"],
+            strict_parser=config["ruz_strict_parser"],
+            executor=config["ruz_executor"],
+            executor_workers=config["ruz_executor_workers"],
+        )
+        set_stale_window(
+            stale_ttl=config["ruz_stale_ttl"], grace=config["ruz_grace"],
+        )
+        yield client
+        await client.close()
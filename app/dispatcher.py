@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List
+
+from app.longpoll import Message
+from app.ruz.client import LatencyTracker
+
+log = logging.getLogger(__name__)
+
+
+class MessageQueue:
+    """
+    Ограниченная очередь входящих сообщений, разбитая на шарды по peer_id
+
+    У каждого шарда свой обработчик: сообщения одного пользователя попадают
+    в один шард и обрабатываются строго по порядку, а разные пользователи -
+    параллельно в разных шардах
+
+    Когда шард заполнен, put ждет свободного места: longpoll перестает
+    забирать новые события, пока обработчики не разгрузятся
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Message], Awaitable],
+        workers: int = 20,
+        maxsize: int = 1000,
+    ) -> None:
+        """
+        :param handler: корутина обработки одного сообщения
+        :param workers: количество шардов, т.е. одновременно обрабатываемых сообщений
+        :param maxsize: максимальная суммарная длина очереди
+        """
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.shards = [
+            asyncio.Queue(max(maxsize // workers, 1)) for _ in range(workers)
+        ]
+        self.wait_time = LatencyTracker()
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0
+        self._saturated = [False] * workers
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.ensure_future(self._worker(queue)) for queue in self.shards
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self) -> None:
+        """
+        Ждет обработки всех сообщений в очереди
+        """
+        for queue in self.shards:
+            await queue.join()
+
+    def _shard(self, message: Message) -> asyncio.Queue:
+        index = message.peer_id % self.workers
+        queue = self.shards[index]
+        if queue.full():
+            self.blocked += 1
+            if not self._saturated[index]:
+                log.warning("Message queue shard %s is full: %s", index, self.stats())
+            self._saturated[index] = True
+        elif queue.qsize() < queue.maxsize // 2:
+            self._saturated[index] = False
+        return queue
+
+    async def put(self, message: Message) -> None:
+        """
+        Ставит сообщение в очередь, при заполненном шарде ждет места
+        """
+        await self._shard(message).put((time.monotonic(), message))
+
+    def put_nowait(self, message: Message) -> bool:
+        """
+        Ставит сообщение в очередь без ожидания
+
+        :return: False, если шард заполнен и сообщение не принято
+        """
+        queue = self._shard(message)
+        if queue.full():
+            return False
+        queue.put_nowait((time.monotonic(), message))
+        return True
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            queued_at, message = await queue.get()
+            self.wait_time.add(time.monotonic() - queued_at)
+            self.busy += 1
+            try:
+                await self.handler(message)
+            except Exception:
+                self.failed += 1
+                log.exception("Error handling message from %s", message.peer_id)
+            finally:
+                self.busy -= 1
+                self.processed += 1
+                queue.task_done()
+
+    def stats(self) -> dict:
+        depths = [queue.qsize() for queue in self.shards]
+        return dict(
+            depth=sum(depths),
+            max_shard_depth=max(depths),
+            maxsize=self.maxsize,
+            workers=self.workers,
+            busy=self.busy,
+            processed=self.processed,
+            failed=self.failed,
+            blocked=self.blocked,
+            wait_p50=self.wait_time.percentile(0.5),
+            wait_p99=self.wait_time.percentile(0.99),
+        )
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import re
+from asyncio import TimeoutError
+from typing import Dict, Iterable, List, Optional
+
+import ujson
+from aiohttp import ClientError
+from aiovk import API
+from aiovk.exceptions import VkAPIError
+from pymysql import MySQLError
+
+from app.dependency import connection
+from app.models import ShortLink
+from app.ruz.cache import AsyncTTLCache
+
+log = logging.getLogger(__name__)
+
+LINK = re.compile(r"(https?://)([\da-z.-]+)\.([a-z.]{2,6})[/\w.-]*")
+VK_LINK = re.compile(r"^(https?://)?vk\.com/([\w.-]+)$")
+
+# Максимум обращений к API в одном execute
+EXECUTE_LIMIT = 25
+
+# Исходная ссылка -> сокращенная, общие для всех ботов
+SHORT_LINKS = AsyncTTLCache(ttl=30 * 24 * 3600, maxsize=8192, name="short_links")
+
+
+class LinkShortener:
+    """
+    Сокращает ссылки из расписания через vk.cc
+
+    Сокращенные ссылки запоминаются в памяти и в таблице short_links,
+    а все новые ссылки одного сообщения сокращаются одним запросом execute
+    """
+
+    def __init__(self, vk: API, db: connection = None) -> None:
+        self.vk = vk
+        self.db = db
+
+    @staticmethod
+    def shorten_locally(url: str) -> Optional[str]:
+        """
+        Ссылка для вывода, если для неё не нужен VK, иначе None
+        """
+        if not LINK.match(url):
+            return url
+        vk_link = VK_LINK.match(url)
+        if vk_link:
+            return "@" + vk_link.group(2)
+        return None
+
+    async def shorten(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Сокращает ссылки, обращаясь к VK не больше одного раза
+
+        :param urls: ссылки из расписания
+        :return: ссылка из расписания -> ссылка для вывода
+        """
+        res = {}
+        unknown = {}
+        for url in urls:
+            stripped = url.strip()
+            short = self.shorten_locally(stripped)
+            if short is None:
+                short = SHORT_LINKS.get(stripped)
+            if short is None:
+                unknown.setdefault(stripped, []).append(url)
+            else:
+                res[url] = short
+        if not unknown:
+            return res
+
+        shortened = await self._load(list(unknown))
+        new = [url for url in unknown if url not in shortened]
+        if new:
+            created = await self._shorten_remote(new)
+            await self._save(created)
+            shortened.update(created)
+        for stripped, originals in unknown.items():
+            short = shortened.get(stripped)
+            if short is not None:
+                SHORT_LINKS.set(stripped, short)
+            for url in originals:
+                # Если VK не ответил, показываем ссылку как есть
+                res[url] = short or stripped
+        return res
+
+    async def _load(self, urls: List[str]) -> Dict[str, str]:
+        if self.db is None:
+            return {}
+        try:
+            async with self.db() as conn:
+                rows = await (await conn.execute(ShortLink.search(urls))).fetchall()
+        except MySQLError:
+            log.exception("Can't load short links")
+            return {}
+        return {row.url: row.short_url for row in rows if row.url in urls}
+
+    async def _save(self, links: Dict[str, str]) -> None:
+        if self.db is None or not links:
+            return
+        try:
+            async with self.db() as conn:
+                await conn.execute(ShortLink.add_many(links))
+        except MySQLError:
+            log.exception("Can't save short links")
+
+    async def _shorten_remote(self, urls: List[str]) -> Dict[str, str]:
+        chunks = await asyncio.gather(
+            *(
+                self._execute(urls[i : i + EXECUTE_LIMIT])
+                for i in range(0, len(urls), EXECUTE_LIMIT)
+            )
+        )
+        return {url: short for chunk in chunks for url, short in chunk.items()}
+
+    async def _execute(self, urls: List[str]) -> Dict[str, str]:
+        code = "return [%s];" % ",".join(
+            f"API.utils.getShortLink({{url: {ujson.dumps(url)}}}).short_url"
+            for url in urls
+        )
+        try:
+            response = await self.vk.execute(code=code)
+        except (VkAPIError, ClientError, TimeoutError) as e:
+            log.warning("Can't shorten %s links: %r", len(urls), e)
+            return {}
+        return {url: short for url, short in zip(urls, response) if short}
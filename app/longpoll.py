@@ -1,13 +1,34 @@
 # COPIED FROM AIOVK
 
-import json
 from abc import ABC, abstractmethod
-from typing import Union, Optional
+from typing import List, NamedTuple, Union, Optional
 
 from aiovk import API
 from aiovk.api import LazyAPI
 from aiovk.exceptions import VkLongPollError
 
+try:
+    from orjson import loads
+except ImportError:
+    from ujson import loads
+
+
+class Message(NamedTuple):
+    """Incoming message: only the fields the bot reads"""
+    peer_id: int
+    text: str
+    payload: Optional[str]
+
+
+def message_from_update(update: dict) -> Optional[Message]:
+    """Message from a longpoll or callback event, None for other event types"""
+    if update.get('type') != 'message_new':
+        return None
+    message = update['object']
+    # Since API 5.103 the message is nested in the object
+    message = message.get('message', message)
+    return Message(message['peer_id'], message['text'], message.get('payload'))
+
 
 class BaseLongPoll(ABC):
     """Interface for all types of Longpoll API"""
@@ -53,47 +74,49 @@ class BaseLongPoll(ABC):
         """
 
     async def wait(self, need_pts=False) -> dict:
-        """Send long poll request
+        """Send long poll request, repeating it until the server returns events
 
         :param need_pts: need return the pts field
         """
-        if not self.base_url:
-            await self._get_long_poll_server(need_pts)
-
-        params = {
-            'ts': self.ts,
-            'key': self.key,
-        }
-        params.update(self.base_params)
-        # invalid mimetype from server
-        status, response = await self.api._session.driver.get_text(
-            self.base_url, params,
-            timeout=2 * self.base_params['wait']
-        )
-
-        if status == 403:
-            raise VkLongPollError(403, 'smth weth wrong', self.base_url + '/', params)
-
-        response = json.loads(response)
-        failed = response.get('failed')
-
-        if not failed:
-            self.ts = response['ts']
-            return response
-
-        if failed == 1:
-            self.ts = response['ts']
-        elif failed == 4:
-            raise VkLongPollError(
-                4,
-                'An invalid version number was passed in the version parameter',
-                self.base_url + '/',
-                params
+        while True:
+            if not self.base_url:
+                await self._get_long_poll_server(need_pts)
+
+            params = {
+                'ts': self.ts,
+                'key': self.key,
+            }
+            params.update(self.base_params)
+            # invalid mimetype from server, the driver must return raw bytes
+            status, response = await self.api._session.driver.get_bytes(
+                self.base_url, params,
+                timeout=2 * self.base_params['wait']
             )
-        else:
-            self.base_url = None
 
-        return await self.wait()
+            if status == 403:
+                raise VkLongPollError(
+                    403, 'smth weth wrong', self.base_url + '/', params
+                )
+
+            response = loads(response)
+            failed = response.get('failed')
+
+            if not failed:
+                self.ts = response['ts']
+                return response
+
+            if failed == 1:
+                self.ts = response['ts']
+            elif failed == 4:
+                raise VkLongPollError(
+                    4,
+                    'An invalid version number was passed in the version parameter',
+                    self.base_url + '/',
+                    params
+                )
+            else:
+                # failed 2 and 3: key or ts expired, get a new server
+                self.base_url = None
     
     async def iter(self):
         while True:
@@ -143,3 +166,13 @@ class BotsLongPoll(BaseLongPoll):
         self.ts = response['ts']
         self.key = response['key']
         self.base_url = '{}'.format(response['server'])  # Method already returning url with https://
+
+    async def wait_messages(self) -> List[Message]:
+        """Wait for events and return only new messages"""
+        response = await self.wait()
+        messages = []
+        for update in response['updates']:
+            message = message_from_update(update)
+            if message is not None:
+                messages.append(message)
+        return messages
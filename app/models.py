@@ -1,8 +1,10 @@
+import hashlib
 import logging
+from typing import Dict, List
 
 import sqlalchemy as sa
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Integer, String, Column, Boolean, MetaData
+from sqlalchemy import Integer, String, Column, Boolean, MetaData, Text
 
 from app.utils.constants import CHANGES
 
@@ -47,6 +49,21 @@ class User(db):
             ]
         ).where(cls.subscription_time == time)
 
+    @classmethod
+    def most_popular(cls, limit: int) -> sa.sql:
+        """
+        Группы и преподаватели, выбранные наибольшим числом пользователей
+        """
+        users = sa.func.count(cls.id).label("users")
+        return (
+            sa.select([cls.current_id, cls.role, users])
+            .where(cls.current_id.isnot(None))
+            .where(cls.role.isnot(None))
+            .group_by(cls.current_id, cls.role)
+            .order_by(users.desc())
+            .limit(limit)
+        )
+
     @classmethod
     def search_user(cls, id: int) -> sa.sql:
         """
@@ -75,6 +92,47 @@ class User(db):
         return cls.__table__.update().values(**values).where(cls.id == id)
 
 
+class ShortLink(db):
+    __tablename__ = "short_links"
+    __table__: sa.sql.schema.Table
+
+    # sha256 ссылки: сами ссылки бывают длиннее допустимого для индекса
+    hash = Column(String(64), primary_key=True)
+    url = Column(Text, nullable=False)
+    short_url = Column(String(256), nullable=False)
+
+    @staticmethod
+    def hash_url(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    @classmethod
+    def search(cls, urls: List[str]) -> sa.sql:
+        """
+        Ищет сокращенные ссылки для urls
+        """
+        return sa.select([cls.url, cls.short_url]).where(
+            cls.hash.in_([cls.hash_url(url) for url in urls])
+        )
+
+    @classmethod
+    def add_many(cls, links: Dict[str, str]) -> sa.sql:
+        """
+        Сохраняет сокращенные ссылки, уже сохраненные пропускаются
+
+        :param links: ссылка -> сокращенная ссылка
+        """
+        return (
+            cls.__table__.insert()
+            .prefix_with("IGNORE")
+            .values(
+                [
+                    dict(hash=cls.hash_url(url), url=url, short_url=short_url)
+                    for url, short_url in links.items()
+                ]
+            )
+        )
+
+
 class DBResultProxy:
     _table: tuple  # Must be implemented in subclass
     _fields: dict
@@ -1,24 +1,310 @@
-from datetime import datetime, timedelta
-from functools import lru_cache, wraps
+import asyncio
+import gzip
+import logging
+import os
+import pickle
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
 
+from aiomisc import threaded
 
-def timed_cache(**timedelta_kwargs):
-    def _wrapper(f):
-        update_delta = timedelta(**timedelta_kwargs)
-        next_update = datetime.utcnow() + update_delta
+log = logging.getLogger(__name__)
+
+# Все созданные кэши по имени, для статистики
+CACHES: Dict[str, "AsyncTTLCache"] = {}
+
+# Увеличивается при несовместимом изменении закэшированных значений
+SNAPSHOT_VERSION = 2
+
+
+class AsyncTTLCache:
+    """
+    Кэш результатов корутин с ограничением размера (LRU) и временем жизни записей
+
+    Одновременные запросы одного ключа объединяются в один вызов (single-flight)
+
+    Режим stale-while-revalidate: запись, просроченная не более чем на stale_ttl,
+    отдается сразу, а в фоне запрашивается новая. Если источник отвечает ошибкой,
+    то в течение grace после истечения ttl отдается последнее удачное значение.
+    Устаревшие значения перед отдачей проходят через on_stale
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 1024,
+        cache_if: Callable[[Any], bool] = None,
+        on_stale: Callable[[Any], Any] = None,
+        stale_ttl: float = 0,
+        grace: float = 0,
+        name: str = None,
+    ) -> None:
+        """
+        :param ttl: время жизни записи в секундах
+        :param maxsize: максимальное количество записей
+        :param cache_if: предикат, какие результаты можно класть в кэш
+        :param on_stale: пометка значения как возможно устаревшего
+        :param stale_ttl: сколько секунд после ttl отдавать запись с фоновым обновлением
+        :param grace: сколько секунд после ttl отдавать запись при ошибках источника
+        :param name: имя кэша для статистики
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cache_if = cache_if
+        self.on_stale = on_stale
+        self.stale_ttl = stale_ttl
+        self.grace = grace
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self.evictions = 0
+        if name is not None:
+            CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """
+        Возвращает живое значение из кэша без обращения к источнику
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        """
+        Возвращает значение из кэша, а если его нет - вызывает fetch
+
+        Пока fetch выполняется, остальные запросы этого ключа ждут его результат
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            expired_for = time.monotonic() - entry[0]
+            if expired_for < 0:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            if expired_for < self.stale_ttl:
+                self.stale_hits += 1
+                self._data.move_to_end(key)
+                self._fetch(key, fetch)
+                return self._stale(entry[1])
+            if expired_for >= self.grace:
+                del self._data[key]
+                entry = None
+
+        try:
+            # shield - отмена одного из ожидающих не отменяет запрос для остальных
+            result = await asyncio.shield(self._fetch(key, fetch))
+        except Exception:
+            if entry is None:
+                raise
+            self.fallbacks += 1
+            return self._stale(entry[1])
+        if entry is not None and not self._cacheable(result):
+            self.fallbacks += 1
+            return self._stale(entry[1])
+        return result
+
+    async def refresh(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        """
+        Обновляет запись из источника, не дожидаясь истечения ttl
+        """
+        return await asyncio.shield(self._fetch(key, fetch))
+
+    def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable]) -> asyncio.Future:
+        task = self._pending.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        self.misses += 1
+        task = asyncio.ensure_future(fetch())
+        self._pending[key] = task
+        task.add_done_callback(lambda t: self._fetched(key, t))
+        return task
+
+    def _fetched(self, key: Hashable, task: asyncio.Future) -> None:
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        # Неудачный ответ не затирает последнее удачное значение
+        if self._cacheable(result):
+            self.set(key, result)
+
+    def _cacheable(self, value) -> bool:
+        return self.cache_if is None or self.cache_if(value)
+
+    def _stale(self, value):
+        return value if self.on_stale is None else self.on_stale(value)
+
+    def dump(self) -> List[tuple]:
+        """
+        Записи кэша для сохранения на диск
+
+        :return: [(ключ, время истечения по time.time, значение), ...]
+        """
+        shift = time.time() - time.monotonic()
+        return [
+            (key, expires + shift, value)
+            for key, (expires, value) in self._data.items()
+        ]
 
-        # No cache size limit
-        f = lru_cache(None)(f)
+    def load(self, entries: List[tuple]) -> int:
+        """
+        Восстанавливает записи, сохраненные dump, пропуская уже бесполезные
+
+        :return: количество восстановленных записей
+        """
+        shift = time.time() - time.monotonic()
+        keep_for = max(self.stale_ttl, self.grace)
+        now = time.time()
+        loaded = 0
+        for key, expires, value in entries:
+            if expires + keep_for > now and key not in self._data:
+                self._data[key] = (expires - shift, value)
+                loaded += 1
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return loaded
+
+    def stats(self) -> dict:
+        return dict(
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            stale_hits=self.stale_hits,
+            misses=self.misses,
+            coalesced=self.coalesced,
+            fallbacks=self.fallbacks,
+            evictions=self.evictions,
+        )
+
+
+def args_key(*args, **kwargs) -> Hashable:
+    return args, tuple(sorted(kwargs.items()))
+
+
+def async_cache(
+    maxsize: int = 1024,
+    cache_if: Callable[[Any], bool] = None,
+    on_stale: Callable[[Any], Any] = None,
+    key: Callable[..., Hashable] = args_key,
+    **timedelta_kwargs,
+):
+    """
+    Декоратор кэширования корутины по её аргументам
+
+    Пример: @async_cache(maxsize=256, minutes=2)
+
+    :param key: функция, строящая ключ кэша из аргументов вызова
+    """
+
+    def _wrapper(f):
+        cache = AsyncTTLCache(
+            ttl=timedelta(**timedelta_kwargs).total_seconds(),
+            maxsize=maxsize,
+            cache_if=cache_if,
+            on_stale=on_stale,
+            name=f.__qualname__,
+        )
 
         @wraps(f)
-        def _wrapped(*args, **kwargs):
-            nonlocal next_update
-            now = datetime.utcnow()
-            if now >= next_update:
-                f.cache_clear()
-                next_update = now + update_delta
-            return f(*args, **kwargs)
+        async def _wrapped(*args, **kwargs):
+            return await cache.get_or_fetch(
+                key(*args, **kwargs), lambda: f(*args, **kwargs)
+            )
+
+        async def _refresh(*args, **kwargs):
+            return await cache.refresh(key(*args, **kwargs), lambda: f(*args, **kwargs))
 
+        _wrapped.cache = cache
+        _wrapped.refresh = _refresh
         return _wrapped
 
     return _wrapper
+
+
+def set_stale_window(stale_ttl: float, grace: float) -> None:
+    """
+    Включает stale-while-revalidate для всех кэшей
+    """
+    for cache in CACHES.values():
+        cache.stale_ttl = stale_ttl
+        cache.grace = grace
+
+
+def cache_stats() -> Dict[str, dict]:
+    """
+    Счетчики попаданий, промахов и вытеснений всех кэшей
+    """
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+async def save_snapshot(path: str) -> None:
+    """
+    Сохраняет все кэши в файл
+
+    В цикле событий только копируются списки записей, сериализация
+    и запись выполняются в потоке: значения в кэшах не изменяются
+    """
+    await _write_snapshot(
+        path, {name: cache.dump() for name, cache in CACHES.items()}
+    )
+
+
+@threaded
+def _write_snapshot(path: str, caches: Dict[str, List[tuple]]) -> None:
+    payload = pickle.dumps((SNAPSHOT_VERSION, caches), protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Пишем во временный файл, чтобы не оставить битый снимок при падении
+    with gzip.open(path + ".tmp", "wb") as snapshot:
+        snapshot.write(payload)
+    os.replace(path + ".tmp", path)
+
+
+def load_snapshot(path: str) -> int:
+    """
+    Загружает кэши из файла, сохраненного save_snapshot
+
+    :return: количество восстановленных записей
+    """
+    try:
+        with gzip.open(path, "rb") as snapshot:
+            version, caches = pickle.load(snapshot)
+    except FileNotFoundError:
+        return 0
+    except Exception:
+        log.exception("Can't load cache snapshot %s", path)
+        return 0
+    if version != SNAPSHOT_VERSION:
+        log.warning("Skip cache snapshot %s of version %s", path, version)
+        return 0
+    return sum(
+        CACHES[name].load(entries) for name, entries in caches.items() if name in CACHES
+    )
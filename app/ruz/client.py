@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import time
+from asyncio import TimeoutError
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Dict, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from aiomisc import ProcessPoolExecutor
+from aiomisc.circuit_breaker import CircuitBreaker
+from ujson import loads, dumps
+
+log = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Скользящее окно времени ответов одного эндпоинта
+    """
+
+    def __init__(self, window: int = 500) -> None:
+        self._samples = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        :param q: от 0 до 1
+        """
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+class Endpoint:
+    """
+    Состояние одного эндпоинта портала: предохранитель и статистика задержек
+    """
+
+    def __init__(
+        self,
+        name: str,
+        min_timeout: float,
+        max_timeout: float,
+        timeout_factor: float,
+        min_samples: int = 20,
+    ) -> None:
+        self.name = name
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            error_ratio=0.5,
+            response_time=10,
+            exceptions=(ClientError, TimeoutError, ValueError),
+            broken_time=5,
+            recovery_time=10,
+        )
+
+    def timeout(self, limit: float = None) -> float:
+        """
+        Таймаут по наблюдаемому p99, но не больше limit
+        """
+        limit = min(limit or self.max_timeout, self.max_timeout)
+        if len(self.latency) < self.min_samples:
+            return limit
+        p99 = self.latency.percentile(0.99)
+        return min(limit, max(self.min_timeout, p99 * self.timeout_factor))
+
+    def stats(self) -> dict:
+        return dict(
+            state=self.breaker.state.name,
+            p50=self.latency.percentile(0.5),
+            p90=self.latency.percentile(0.9),
+            p99=self.latency.percentile(0.99),
+            timeout=self.timeout(),
+        )
+
+
+class RuzClient:
+    """
+    Долгоживущий HTTP клиент портала РУЗ
+
+    Держит пул keep-alive соединений к ruz.fa.ru на всё время работы сервиса,
+    чтобы не делать TCP+TLS рукопожатие на каждый запрос
+
+    Каждый эндпоинт (schedule, search, ...) закрыт своим предохранителем:
+    если портал массово отвечает ошибками, запросы к нему сразу завершаются
+    CircuitBroken, а после паузы пропускаются пробные запросы
+
+    Хеджирование: если ответ не пришел за p90 времени ответа эндпоинта,
+    отправляется второй такой же запрос, побеждает первый ответивший.
+    Дополнительные запросы ограничены долей hedge_ratio от всех запросов
+
+    Разбор и форматирование расписания выполняются через run: в цикле событий
+    (executor="off"), в пуле потоков ("thread") или в пуле процессов ("process")
+    """
+
+    EXECUTORS = ("off", "thread", "process")
+
+    BASE_URL = "https://ruz.fa.ru"
+
+    session: ClientSession
+    endpoints: Dict[str, Endpoint]
+
+    def __init__(
+        self,
+        limit_per_host: int = 20,
+        dns_ttl: int = 300,
+        keepalive_timeout: int = 60,
+        min_timeout: float = 1,
+        max_timeout: float = 10,
+        timeout_factor: float = 3,
+        hedge_ratio: float = 0.1,
+        strict_parser: bool = False,
+        executor: str = "off",
+        executor_workers: int = None,
+        base_url: str = BASE_URL,
+    ) -> None:
+        """
+        :param limit_per_host: максимум одновременных соединений к порталу
+        :param dns_ttl: время жизни DNS кэша в секундах
+        :param keepalive_timeout: время жизни простаивающего соединения в секундах
+        :param min_timeout: нижняя граница адаптивного таймаута в секундах
+        :param max_timeout: верхняя граница адаптивного таймаута в секундах
+        :param timeout_factor: во сколько раз таймаут больше p99 времени ответа
+        :param hedge_ratio: максимальная доля дополнительных запросов, 0 - выключено
+        :param strict_parser: разбирать расписание через marshmallow с валидацией
+        :param executor: где выполнять разбор и форматирование: off, thread, process
+        :param executor_workers: количество процессов для executor="process"
+        :param base_url: адрес портала
+        """
+        self.base_url = base_url.rstrip("/")
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.hedge_ratio = hedge_ratio
+        self.strict_parser = strict_parser
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}")
+        self.executor_mode = executor
+        self.executor: Optional[Executor] = None
+        if executor == "process":
+            self.executor = ProcessPoolExecutor(executor_workers)
+        # Каждый запрос добавляет hedge_ratio, каждый дополнительный тратит 1
+        self.hedge_budget = 0.0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.endpoints = {}
+        self.session = ClientSession(
+            connector=TCPConnector(
+                limit_per_host=limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=dns_ttl,
+                keepalive_timeout=keepalive_timeout,
+            ),
+            headers={"Accept-Encoding": "gzip, deflate"},
+            json_serialize=dumps,
+            raise_for_status=True,
+        )
+
+    def endpoint(self, path: str) -> Endpoint:
+        """
+        Эндпоинт по пути запроса: "/api/schedule/group/1" -> "schedule"
+        """
+        name = path.strip("/").split("/")[1]
+        if name not in self.endpoints:
+            self.endpoints[name] = Endpoint(
+                name, self.min_timeout, self.max_timeout, self.timeout_factor
+            )
+        return self.endpoints[name]
+
+    async def get_json(
+        self,
+        path: str,
+        params: dict = None,
+        timeout: float = None,
+        raw: bool = False,
+        parser: Callable = None,
+    ):
+        """
+        GET запрос к порталу с разбором JSON ответа
+
+        :param path: путь относительно адреса портала, например "/api/search"
+        :param params: query параметры
+        :param timeout: максимальный таймаут на весь запрос в секундах
+        :param raw: вернуть тело ответа без разбора
+        :param parser: фабрика потокового разборщика с методами feed(bytes) и close(),
+            тело ответа передается ему по мере получения, результат - close()
+        :return: разобранный JSON
+        :raises CircuitBroken: если предохранитель эндпоинта разомкнут
+        """
+        endpoint = self.endpoint(path)
+        return await endpoint.breaker.call_async(
+            self._hedged_get_json,
+            endpoint,
+            path,
+            params,
+            endpoint.timeout(timeout),
+            raw,
+            parser,
+        )
+
+    async def _hedged_get_json(
+        self,
+        endpoint: Endpoint,
+        path: str,
+        params: dict,
+        timeout: float,
+        raw: bool,
+        parser: Optional[Callable],
+    ):
+        # Одна выборка на весь запрос от первой отправки: отмененный проигравший
+        # и хедж, отсчитанный от своего старта, прятали бы медленный хвост,
+        # и p90 с p99 со временем занижались бы
+        started = time.monotonic()
+        try:
+            result = await self._first_response(
+                endpoint, path, params, timeout, raw, parser
+            )
+        except TimeoutError:
+            # Иначе при замедлении портала таймаут никогда не вырастет
+            endpoint.latency.add(timeout)
+            raise
+        endpoint.latency.add(time.monotonic() - started)
+        return result
+
+    async def _first_response(
+        self,
+        endpoint: Endpoint,
+        path: str,
+        params: dict,
+        timeout: float,
+        raw: bool,
+        parser: Optional[Callable],
+    ):
+        self.hedge_budget = min(self.hedge_budget + self.hedge_ratio, 10)
+        delay = None
+        if self.hedge_ratio and len(endpoint.latency) >= endpoint.min_samples:
+            delay = endpoint.latency.percentile(0.9)
+        if delay is None or delay >= timeout:
+            return await self._get_json(path, params, timeout, raw, parser)
+
+        first = asyncio.ensure_future(
+            self._get_json(path, params, timeout, raw, parser)
+        )
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.hedge_budget >= 1:
+                self.hedge_budget -= 1
+                self.hedged += 1
+                tasks.add(
+                    asyncio.ensure_future(
+                        self._get_json(path, params, timeout - delay, raw, parser)
+                    )
+                )
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get_json(
+        self,
+        path: str,
+        params: dict,
+        timeout: float,
+        raw: bool,
+        parser: Optional[Callable],
+    ):
+        async with self.session.get(
+            self.base_url + path, params=params, timeout=ClientTimeout(total=timeout),
+        ) as response:
+            if parser is not None:
+                # У каждого запроса (в т.ч. хеджированного) свой разборщик
+                stream = parser()
+                async for chunk in response.content.iter_any():
+                    stream.feed(chunk)
+                return stream.close()
+            if raw:
+                return await response.read()
+            return await response.json(loads=loads)
+
+    async def run(self, func: Callable, *args):
+        """
+        Выполняет func(*args) в выбранном исполнителе
+
+        Для executor="process" аргументы и результат должны быть простыми данными
+        """
+        if self.executor_mode == "off":
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, partial(func, *args)
+        )
+
+    def stats(self) -> Dict[str, dict]:
+        stats = {name: endpoint.stats() for name, endpoint in self.endpoints.items()}
+        stats["hedging"] = dict(hedged=self.hedged, wins=self.hedge_wins)
+        return stats
+
+    async def close(self) -> None:
+        await self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
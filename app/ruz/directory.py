@@ -0,0 +1,201 @@
+import heapq
+import time
+from collections import defaultdict
+from difflib import get_close_matches
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def trigrams(words: Iterable[str]) -> Set[str]:
+    res = set()
+    for word in words:
+        word = f" {word} "
+        res.update(word[i : i + 3] for i in range(len(word) - 2))
+    return res
+
+
+class GroupIndex:
+    """
+    Локальный справочник групп: название -> id
+
+    Хранит и неудачные поиски (негативный кэш) вместе с подсказками,
+    чтобы опечатки не уходили на портал и не искались заново
+
+    Похожие названия ищутся difflib только среди групп с наибольшим
+    числом общих триграмм, а не по всему справочнику
+    """
+
+    # Сколько групп с общими триграммами сравнивать через difflib
+    candidates: int = 100
+
+    def __init__(self, negative_ttl: float = 600) -> None:
+        """
+        :param negative_ttl: сколько секунд помнить, что группы нет
+        """
+        self.negative_ttl = negative_ttl
+        self._ids: Dict[str, str] = {}
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        # название -> (когда забыть, подсказки или None, если еще не искали)
+        self._missing: Dict[str, Tuple[float, Optional[List[str]]]] = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return name.strip().replace(" ", "").upper()
+
+    def load(self, groups: Iterable[Tuple[str, str]]) -> None:
+        """
+        Заменяет справочник целиком
+
+        :param groups: [(id, название), ...]
+        """
+        self._ids = {self.normalize(label): str(id) for id, label in groups}
+        self._trigrams = defaultdict(set)
+        for name in self._ids:
+            self._index(name)
+        # Подсказки найдены по старому справочнику
+        self._missing = {
+            name: (expires, None)
+            for name, (expires, _) in self._missing.items()
+            if name not in self._ids
+        }
+        self.loaded = True
+
+    def _index(self, name: str) -> None:
+        for trigram in trigrams((name,)):
+            self._trigrams[trigram].add(name)
+
+    def add(self, name: str, id: str) -> None:
+        name = self.normalize(name)
+        if name not in self._ids:
+            self._index(name)
+        self._ids[name] = str(id)
+        self._missing.pop(name, None)
+
+    def resolve(self, name: str) -> Optional[str]:
+        return self._ids.get(self.normalize(name))
+
+    def mark_missing(self, name: str) -> None:
+        self._missing[self.normalize(name)] = (
+            time.monotonic() + self.negative_ttl,
+            None,
+        )
+
+    def is_missing(self, name: str) -> bool:
+        name = self.normalize(name)
+        entry = self._missing.get(name)
+        if entry is None:
+            return False
+        if entry[0] <= time.monotonic():
+            del self._missing[name]
+            return False
+        return True
+
+    def suggest(self, name: str, count: int = 3) -> List[str]:
+        """
+        Похожие названия групп для опечаток, для отсутствующих групп запоминаются
+        """
+        name = self.normalize(name)
+        entry = self._missing.get(name)
+        if entry is not None and entry[1] is not None:
+            return entry[1][:count]
+        shared = defaultdict(int)
+        for trigram in trigrams((name,)):
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        # Доля общих триграмм с поправкой на длину названия
+        candidates = heapq.nlargest(
+            self.candidates,
+            shared,
+            key=lambda candidate: shared[candidate] / (len(candidate) + len(name)),
+        )
+        suggestions = get_close_matches(name, candidates, n=count, cutoff=0.7)
+        if entry is not None:
+            self._missing[name] = (entry[0], suggestions)
+        return suggestions
+
+
+class TeacherIndex:
+    """
+    Локальный поисковый индекс преподавателей
+
+    Ищет по префиксам слов ФИО, а при опечатках - по общим триграммам
+    """
+
+    def __init__(self, min_similarity: float = 0.5) -> None:
+        """
+        :param min_similarity: минимальная доля общих триграмм для нечеткого поиска
+        """
+        self.min_similarity = min_similarity
+        self._labels: Dict[str, str] = {}
+        self._words: Dict[str, Tuple[str, ...]] = {}
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    @staticmethod
+    def split(name: str) -> Tuple[str, ...]:
+        return tuple(name.lower().replace("ё", "е").replace(".", " ").split())
+
+    trigrams = staticmethod(trigrams)
+
+    def load(self, teachers: Iterable[Tuple[str, str]]) -> None:
+        """
+        Заменяет индекс целиком
+
+        :param teachers: [(id, ФИО), ...]
+        """
+        self._labels = {}
+        self._words = {}
+        self._trigrams = defaultdict(set)
+        self.add_many(teachers)
+        self.loaded = True
+
+    def add_many(self, teachers: Iterable[Tuple[str, str]]) -> None:
+        for id, label in teachers:
+            id = str(id)
+            if id in self._labels:
+                continue
+            words = self.split(label)
+            self._labels[id] = label
+            self._words[id] = words
+            for trigram in self.trigrams(words):
+                self._trigrams[trigram].add(id)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        Ищет преподавателей, подходящих под запрос
+
+        :return: [(id, ФИО), ...] от лучшего совпадения к худшему
+        """
+        query_words = self.split(query)
+        if not query_words:
+            return []
+        query_trigrams = self.trigrams(query_words)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for id in self._trigrams.get(trigram, ()):
+                shared[id] += 1
+
+        exact, fuzzy = [], []
+        for id, count in shared.items():
+            words = self._words[id]
+            similarity = count / len(query_trigrams)
+            if all(
+                any(word.startswith(query_word) for word in words)
+                for query_word in query_words
+            ):
+                exact.append((-similarity, self._labels[id], id))
+            elif similarity >= self.min_similarity:
+                fuzzy.append((-similarity, self._labels[id], id))
+        # Нечеткие совпадения нужны только если точных нет
+        ranked = sorted(exact or fuzzy)
+        return [(id, label) for _, label, id in ranked[:limit]]
+
+
+GROUPS = GroupIndex()
+TEACHERS = TeacherIndex()
@@ -0,0 +1,178 @@
+import codecs
+import json
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Iterable, List
+
+from ujson import loads
+
+from app.ruz.schemas import (
+    merge_pairs,
+    PairMerger,
+    ScheduleSchema,
+    NO_AUDIENCE,
+    NO_NAME,
+    NO_TEACHER,
+)
+
+SCHEDULE_SCHEMA = ScheduleSchema()
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+
+
+@lru_cache(maxsize=4096)
+def convert_date(value: str) -> str:
+    """
+    'yyyy.mm.dd' -> 'dd.mm.yyyy'
+    """
+    return datetime.strptime(value, "%Y.%m.%d").strftime("%d.%m.%Y")
+
+
+@lru_cache(maxsize=4096)
+def convert_audience(value: str) -> str:
+    # FIXME костыль
+    return value.replace("_", "-").split("/")[-1]
+
+
+def parse_pair(pair: dict) -> dict:
+    """
+    Разбирает одну пару из ответа портала так же, как schemas.Pair, но без валидации
+    """
+    groups = pair.get("group") or pair.get("stream") or ""
+    audience = pair.get("auditorium")
+    return {
+        "time_start": pair["beginLesson"],
+        "time_end": pair.get("endLesson"),
+        "name": pair.get("discipline") or NO_NAME,
+        "type": pair.get("kindOfWork") or "",
+        "groups": set(groups.replace(" ", "").split(",")),
+        "audience": convert_audience(audience) if audience else NO_AUDIENCE,
+        "location": pair.get("building") or "",
+        "teachers_name": pair.get("lecturer") or NO_TEACHER,
+        "date": convert_date(pair["date"]),
+        "note": pair.get("note"),
+        "url1": pair.get("url1") or "",
+        "url1_description": pair.get("url1_description") or "",
+        "url2": pair.get("url2") or "",
+        "url2_description": pair.get("url2_description") or "",
+    }
+
+
+def parse_schedule(pairs: Iterable[dict], strict: bool = False) -> dict:
+    """
+    Разбирает ответ портала с расписанием
+
+    :param pairs: список пар из ответа портала
+    :param strict: разбирать через marshmallow ScheduleSchema с валидацией
+    :return: {'dd.mm.yyyy': (Lesson, ...)}
+    :raises ValueError, KeyError: на некорректных данных
+    :raises ValidationError: на некорректных данных в режиме strict
+    """
+    if strict:
+        return SCHEDULE_SCHEMA.load({"pairs": pairs})
+    return merge_pairs(parse_pair(pair) for pair in pairs)
+
+
+def parse_schedule_body(body: bytes, strict: bool = False) -> dict:
+    """
+    Разбирает тело ответа портала с расписанием, см. parse_schedule
+    """
+    return parse_schedule(loads(body), strict=strict)
+
+
+class JSONArrayStream:
+    """
+    Разбирает JSON массив объектов, приходящий кусками, по одному элементу
+
+    Хранит только текущий недочитанный элемент. Недочитанный и некорректный
+    элемент не различить до конца тела, поэтому ошибка в элементе
+    обнаруживается только в close
+    """
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """
+        :return: элементы массива, закончившиеся в этом куске
+        :raises ValueError: если тело не JSON массив объектов
+        """
+        self._buffer += self._decoder.decode(chunk)
+        items = []
+        pos = self._parse(items)
+        self._buffer = self._buffer[pos:]
+        return items
+
+    def _parse(self, items: List[Any]) -> int:
+        buffer = self._buffer
+        pos = _JSON_SEPARATORS.match(buffer).end()
+        if not self._started:
+            if pos == len(buffer):
+                return pos
+            if buffer[pos] != "[":
+                raise ValueError("Expected JSON array")
+            self._started = True
+            pos += 1
+        while True:
+            pos = _JSON_SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                return pos
+            if self._finished:
+                raise ValueError("Extra data after JSON array")
+            if buffer[pos] == "]":
+                self._finished = True
+                pos += 1
+                continue
+            # Числа и строки нельзя отличить от недочитанных
+            if buffer[pos] not in "{[":
+                raise ValueError("Expected JSON object")
+            try:
+                item, pos = _JSON_DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                # Элемент еще не дочитан
+                return pos
+            items.append(item)
+
+    def close(self) -> List[Any]:
+        """
+        :return: оставшиеся элементы массива
+        :raises ValueError: если массив не закончился или элемент некорректен
+        """
+        self._buffer += self._decoder.decode(b"", final=True)
+        items = []
+        pos = self._parse(items)
+        if pos < len(self._buffer):
+            # Разбираем заново, чтобы получить исходную ошибку
+            _JSON_DECODER.raw_decode(self._buffer, pos)
+        if not self._finished:
+            raise ValueError("Unexpected end of JSON array")
+        return items
+
+
+class ScheduleStreamParser:
+    """
+    Разбирает расписание по мере получения ответа портала, см. parse_schedule
+
+    В памяти одновременно находятся только недочитанная пара и результат
+    """
+
+    def __init__(self) -> None:
+        self._array = JSONArrayStream()
+        self._merger = PairMerger()
+
+    def feed(self, chunk: bytes) -> None:
+        for item in self._array.feed(chunk):
+            self._merger.add(parse_pair(item))
+
+    def close(self) -> dict:
+        """
+        :return: {'dd.mm.yyyy': (Lesson, ...)}
+        """
+        for item in self._array.close():
+            self._merger.add(parse_pair(item))
+        return self._merger.result()
@@ -0,0 +1,112 @@
+import sys
+from typing import FrozenSet, Hashable, NamedTuple, Optional
+
+
+class Lesson(NamedTuple):
+    """
+    Пара в кэше расписания
+
+    Дата не хранится: пары и так разложены по датам
+    """
+
+    time_start: str
+    time_end: Optional[str]
+    name: str
+    type: str
+    groups: FrozenSet[str]
+    audience: str
+    location: str
+    teachers_name: str
+    note: Optional[str]
+    url1: str
+    url1_description: str
+    url2: str
+    url2_description: str
+
+
+class InternTable:
+    """
+    Таблица общих экземпляров одинаковых неизменяемых значений
+    """
+
+    def __init__(self, maxsize: int = 65536) -> None:
+        """
+        :param maxsize: при переполнении таблица очищается
+        """
+        self.maxsize = maxsize
+        self._values = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __call__(self, value: Hashable) -> Hashable:
+        shared = self._values.get(value)
+        if shared is None:
+            if len(self._values) >= self.maxsize:
+                self._values.clear()
+            shared = self._values[value] = value
+        return shared
+
+
+# Одинаковые наборы групп у разных пар и расписаний
+GROUP_SETS = InternTable()
+
+
+def intern_string(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+def make_lesson(pair: dict) -> Lesson:
+    """
+    Сжимает разобранную пару (см. schemas.Pair) в Lesson
+
+    Повторяющиеся строки (преподаватели, дисциплины, аудитории, ...)
+    и наборы групп становятся общими для всех пар
+    """
+    return Lesson(
+        time_start=intern_string(pair["time_start"]),
+        time_end=intern_string(pair["time_end"]),
+        name=intern_string(pair["name"]),
+        type=intern_string(pair["type"]),
+        groups=GROUP_SETS(frozenset(pair["groups"])),
+        audience=intern_string(pair["audience"]),
+        location=intern_string(pair["location"]),
+        teachers_name=intern_string(pair["teachers_name"]),
+        note=pair["note"],
+        url1=pair["url1"],
+        url1_description=intern_string(pair["url1_description"]),
+        url2=pair["url2"],
+        url2_description=intern_string(pair["url2_description"]),
+    )
+
+
+def intern_lesson(lesson: Lesson) -> Lesson:
+    """
+    Заново делает общими строки и группы пары, полученной из другого процесса:
+    после pickle у каждой пары свои копии
+    """
+    return Lesson(
+        time_start=intern_string(lesson.time_start),
+        time_end=intern_string(lesson.time_end),
+        name=intern_string(lesson.name),
+        type=intern_string(lesson.type),
+        groups=GROUP_SETS(lesson.groups),
+        audience=intern_string(lesson.audience),
+        location=intern_string(lesson.location),
+        teachers_name=intern_string(lesson.teachers_name),
+        note=lesson.note,
+        url1=lesson.url1,
+        url1_description=intern_string(lesson.url1_description),
+        url2=lesson.url2,
+        url2_description=intern_string(lesson.url2_description),
+    )
+
+
+def intern_days(days: dict) -> dict:
+    """
+    :param days: {'dd.mm.yyyy': (Lesson, ...)}, см. intern_lesson
+    """
+    return {
+        intern_string(date): tuple(intern_lesson(lesson) for lesson in lessons)
+        for date, lessons in days.items()
+    }
@@ -0,0 +1,213 @@
+import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.ruz.records import Lesson
+
+DAY_NAMES = (
+    "Понедельник",
+    "Вторник",
+    "Среда",
+    "Четверг",
+    "Пятница",
+    "Суббота",
+    "Воскресенье",
+)
+
+# (поле пары, которое должно быть непустым или None, шаблон)
+# Шаблоны - тела f-строк, в них доступны lesson, groups (группы через запятую),
+# link1 и link2 (ссылки для вывода вместо url1 и url2)
+Parts = List[Tuple[Optional[str], str]]
+
+
+class Layout:
+    """
+    Вид сообщения с расписанием
+
+    Для каждого сочетания show_groups и show_location шаблоны пары один раз
+    компилируются в функцию, которая дописывает дни в список строк
+    """
+
+    def __init__(
+        self,
+        day: str,
+        empty: str,
+        end: str,
+        time: str,
+        same_time: str,
+        parts: Callable[[bool, bool], Parts],
+    ) -> None:
+        """
+        :param day: заголовок дня, {name} - день недели, {date} - дата
+        :param empty: текст дня без пар
+        :param end: окончание дня
+        :param time: шаблон заголовка первой пары с данным временем начала
+        :param same_time: шаблон заголовка следующих пар с тем же временем
+        :param parts: (show_groups, show_location) -> части шаблона пары
+        """
+        self.day = day
+        self.empty = empty
+        self.end = end
+        self.time = time
+        self.same_time = same_time
+        self.parts = parts
+        self._compiled: Dict[Tuple[bool, bool], Callable] = {}
+
+    def compile(self, show_groups: bool, show_location: bool) -> Callable:
+        """
+        :return: функция (пары, ссылки, список строк), дописывающая пары в список
+        """
+        options = (show_groups, show_location)
+        compiled = self._compiled.get(options)
+        if compiled is None:
+            compiled = self._compiled[options] = self._compile(*options)
+        return compiled
+
+    def _compile(self, show_groups: bool, show_location: bool) -> Callable:
+        lines = [
+            "def render(lessons, links, out):",
+            "    time_start = None",
+            "    for lesson in lessons:",
+            "        if lesson.time_start != time_start:",
+            "            time_start = lesson.time_start",
+            f"            out.append(f{self.time!r})",
+            "        else:",
+            f"            out.append(f{self.same_time!r})",
+            "        link1 = links.get(lesson.url1)",
+            "        link2 = links.get(lesson.url2)",
+        ]
+        if show_groups:
+            lines.append("        groups = ', '.join(lesson.groups)")
+        parts = []
+        for when, template in self.parts(show_groups, show_location):
+            if when is None and parts and parts[-1][0] is None:
+                # Соседние безусловные части - одна f-строка
+                parts[-1] = (None, parts[-1][1] + template)
+            else:
+                parts.append((when, template))
+        for when, template in parts:
+            if when is None:
+                lines.append(f"        out.append(f{template!r})")
+            else:
+                lines.append(f"        if lesson.{when}:")
+                lines.append(f"            out.append(f{template!r})")
+        namespace = {}
+        exec("\n".join(lines), namespace)
+        return namespace["render"]
+
+    def render_day(
+        self,
+        date: datetime.date,
+        lessons: Tuple[Lesson, ...],
+        show_groups: bool,
+        show_location: bool,
+        links: dict,
+    ) -> str:
+        """
+        Собирает текст расписания на один день
+
+        :param date: день
+        :param lessons: пары этого дня, отсортированные по времени начала
+        :param show_groups:
+        :param show_location:
+        :param links: ссылка из расписания -> ссылка для вывода
+        :return: строку расписания дня
+        """
+        text_date = f"{date.day:02}.{date.month:02}.{date.year}"
+        out = [self.day.format(name=DAY_NAMES[date.weekday()], date=text_date)]
+        if lessons:
+            self.compile(show_groups, show_location)(lessons, links, out)
+        else:
+            out.append(self.empty)
+        out.append(self.end)
+        return "".join(out)
+
+
+def default_parts(show_groups: bool, show_location: bool) -> Parts:
+    parts = [(None, "{lesson.name}\n"), ("type", "{lesson.type}\n")]
+    if show_groups:
+        parts.append(("groups", "Группы: {groups}\n"))
+    parts += [
+        ("audience", "Где: {lesson.audience}"),
+        (None, ", {lesson.location}\n" if show_location else "\n"),
+        (None, "Кто: {lesson.teachers_name}\n"),
+        ("note", "Примечание: {lesson.note}\n"),
+        ("url1", "{lesson.url1_description}: {link1}\n"),
+        ("url2", "{lesson.url2_description}: {link2}\n"),
+    ]
+    return parts
+
+
+def compact_parts(show_groups: bool, show_location: bool) -> Parts:
+    parts = [(None, "{lesson.name}"), ("type", " ({lesson.type})"), (None, "\n")]
+    if show_groups:
+        parts.append(("groups", "👥 {groups}\n"))
+    parts.append((None, "📍 {lesson.audience}"))
+    if show_location:
+        parts.append(("location", ", {lesson.location}"))
+    parts += [
+        (None, " · 👤 {lesson.teachers_name}\n"),
+        ("note", "📝 {lesson.note}\n"),
+        ("url1", "🔗 {link1}\n"),
+        ("url2", "🔗 {link2}\n"),
+    ]
+    return parts
+
+
+def single_line_parts(show_groups: bool, show_location: bool) -> Parts:
+    parts = [
+        (None, "{lesson.name}"),
+        ("type", " ({lesson.type})"),
+        (None, ", {lesson.audience}"),
+    ]
+    if show_location:
+        parts.append(("location", ", {lesson.location}"))
+    parts.append((None, ", {lesson.teachers_name}"))
+    if show_groups:
+        parts.append(("groups", ", {groups}"))
+    parts.append((None, "\n"))
+    return parts
+
+
+LAYOUTS = {
+    "default": Layout(
+        day="📅 {name}, {date}\n",
+        empty="Нет пар\n",
+        end="\n",
+        time="\n⏱{lesson.time_start} – {lesson.time_end}⏱\n",
+        same_time="\n",
+        parts=default_parts,
+    ),
+    "compact": Layout(
+        day="📅 {name}, {date}\n",
+        empty="Нет пар\n",
+        end="\n",
+        time="⏱ {lesson.time_start}–{lesson.time_end} ",
+        same_time="⏱ {lesson.time_start}–{lesson.time_end} ",
+        parts=compact_parts,
+    ),
+    "single_line": Layout(
+        day="{name}, {date}:\n",
+        empty="нет пар\n",
+        end="",
+        time="{lesson.time_start} ",
+        same_time="{lesson.time_start} ",
+        parts=single_line_parts,
+    ),
+}
+
+
+def render_days(
+    days: list, show_groups: bool, show_location: bool, layout: str = "default"
+) -> List[str]:
+    """
+    Собирает тексты нескольких дней, можно выполнять в другом процессе
+
+    :param days: [(день, пары, ссылки), ...], см. Layout.render_day
+    :param layout: название вида из LAYOUTS
+    :return: [строка расписания дня, ...]
+    """
+    render_day = LAYOUTS[layout].render_day
+    return [
+        render_day(date, lessons, show_groups, show_location, links)
+        for date, lessons, links in days
+    ]
@@ -1,7 +1,14 @@
 from datetime import datetime
+from typing import Iterable
 
 from marshmallow import fields, Schema, EXCLUDE, pre_load, post_load
 
+from app.ruz.records import make_lesson
+
+NO_NAME = "Без названия"
+NO_AUDIENCE = "Без аудитории"
+NO_TEACHER = "Преподователь не определен"
+
 
 class DefaultString(fields.String):
     def deserialize(self, value, attr: str = None, data=None, **kwargs):
@@ -37,14 +44,12 @@ class Pair(Schema):
 
     time_start = fields.String(data_key="beginLesson")
     time_end = fields.String(data_key="endLesson")
-    name = DefaultString(data_key="discipline", default="Без названия")
+    name = DefaultString(data_key="discipline", default=NO_NAME)
     type = DefaultString(data_key="kindOfWork", default="")
     groups = fields.Raw()
-    audience = AudienceField(data_key="auditorium", default="Без аудитории")
+    audience = AudienceField(data_key="auditorium", default=NO_AUDIENCE)
     location = DefaultString(data_key="building", default="")
-    teachers_name = DefaultString(
-        data_key="lecturer", default="Преподователь не определен"
-    )
+    teachers_name = DefaultString(data_key="lecturer", default=NO_TEACHER)
     date = DateField()
     note = fields.String(allow_none=True)
     url1 = DefaultString(default="")
@@ -61,30 +66,59 @@ class ScheduleSchema(Schema):
 
     @post_load()
     def post_load(self, data, **kwargs):
-        res = dict()
-        for pairs in data["pairs"]:
-            for time_start, pair in pairs.items():
-                if pair["date"] in res:
-                    for save_pair in res[pair["date"]]:
-                        if (
-                            save_pair["time_start"] == pair["time_start"]
-                            and save_pair["name"] == pair["name"]
-                        ):
-                            save_pair[
-                                "audience"
-                            ] = f"{save_pair['audience']}, {pair['audience']}"
-                            save_pair["groups"] = save_pair["groups"].union(
-                                pair["groups"]
-                            )
-                            save_pair[
-                                "teachers_name"
-                            ] = f"{save_pair['teachers_name']}, {pair['teachers_name']}"
-                            break
-                    else:
-                        res[pair["date"]] = res[pair["date"]] + [pair]
-                else:
-                    res[pair["date"]] = [pair]
+        return merge_pairs(
+            pair for pairs in data["pairs"] for time_start, pair in pairs.items()
+        )
+
+
+class PairMerger:
+    """
+    Раскладывает пары по датам по одной, объединяя одну и ту же пару у разных групп
+
+    Одна и та же пара - совпадают дата, время начала и название. У объединенной
+    пары группы объединяются, а аудитории и преподаватели перечисляются через запятую
+    """
+
+    def __init__(self) -> None:
+        self._days = dict()
+        # (дата, время, название) -> (пара, аудитории, преподаватели)
+        self._merged = dict()
+
+    def add(self, pair: dict) -> None:
+        key = (pair["date"], pair["time_start"], pair["name"])
+        if key in self._merged:
+            save_pair, audiences, teachers = self._merged[key]
+            save_pair["groups"] |= pair["groups"]
+            audiences.append(pair["audience"])
+            teachers.append(pair["teachers_name"])
+        else:
+            self._merged[key] = (pair, [pair["audience"]], [pair["teachers_name"]])
+            self._days.setdefault(pair["date"], []).append(pair)
+
+    def result(self) -> dict:
+        """
+        :return: {'dd.mm.yyyy': (Lesson, ...)} с парами, отсортированными по времени
+        """
+        for pair, audiences, teachers in self._merged.values():
+            if len(audiences) > 1:
+                pair["audience"] = ", ".join(audiences)
+                pair["teachers_name"] = ", ".join(teachers)
         return {
-            date: sorted(pairs, key=lambda x: x["time_start"])
-            for date, pairs in res.items()
+            date: tuple(
+                make_lesson(pair)
+                for pair in sorted(pairs, key=lambda x: x["time_start"])
+            )
+            for date, pairs in self._days.items()
         }
+
+
+def merge_pairs(pairs: Iterable[dict]) -> dict:
+    """
+    Раскладывает пары по датам, см. PairMerger
+
+    :return: {'dd.mm.yyyy': (Lesson, ...)} с парами, отсортированными по времени
+    """
+    merger = PairMerger()
+    for pair in pairs:
+        merger.add(pair)
+    return merger.result()
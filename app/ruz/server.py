@@ -1,17 +1,20 @@
+import asyncio
 from asyncio import TimeoutError
 import datetime
 import logging
-from urllib.parse import quote
+from typing import AsyncIterator, Optional
 
 from marshmallow import ValidationError
-from aiohttp import ClientSession, ClientError
-from ujson import loads
+from aiohttp import ClientError
+from aiomisc import CircuitBroken
 
-from app.ruz.schemas import ScheduleSchema
-
-# from app.ruz.cache import timed_cache
-
-SCHEDULE_SCHEMA = ScheduleSchema()
+from app.ruz.client import RuzClient
+from app.ruz.directory import GROUPS, TEACHERS
+from app.ruz.cache import async_cache, AsyncTTLCache
+from app.ruz.parser import parse_schedule_body, ScheduleStreamParser
+from app.ruz.records import intern_days
+from app.ruz.render import render_days
+from app.utils import strings
 
 log = logging.getLogger(__name__)
 
@@ -24,52 +27,83 @@ class Data:
     data: any
     has_error: bool
     error_text: str
+    stale: bool
 
-    def __init__(self, data: any, has_error: bool = False, error: str = None) -> None:
+    def __init__(
+        self, data: any, has_error: bool = False, error: str = None, stale=False
+    ) -> None:
         self.data = data
         self.has_error = has_error
         self.error_text = error
+        self.stale = stale
 
     @classmethod
     def error(cls, error: str) -> "Data":
         return cls(data={}, has_error=True, error=error)
 
+    def as_stale(self) -> "Data":
+        """
+        Копия данных с пометкой, что они могли устареть
+        """
+        return Data(self.data, self.has_error, self.error_text, stale=True)
+
 
-def date_name(date: datetime) -> str:
+def is_success(data: Data) -> bool:
     """
-    Определяет день недели по дате
+    Ошибки не кэшируются
+    """
+    return not data.has_error
+
 
-    :param date:
-    :return:
+def without_client(client: RuzClient, *args) -> tuple:
+    """
+    Ключ кэша без клиента, чтобы кэш можно было сохранить на диск
     """
+    return args
 
-    return [
-        "Понедельник",
-        "Вторник",
-        "Среда",
-        "Четверг",
-        "Пятница",
-        "Суббота",
-        "Воскресенье",
-    ][date.weekday()]
+
+async def get_group(client: RuzClient, group_name: str) -> Data:
+    """
+    Ищет группу в локальном справочнике, а если её там нет - на сервере
+
+    :param client:
+    :param group_name:
+    :return: id группы в Data, при ошибке "Not found" в data похожие названия
+    """
+    group_id = GROUPS.resolve(group_name)
+    if group_id is not None:
+        return Data(group_id)
+    if not GROUPS.is_missing(group_name):
+        group = await search_group(client, group_name)
+        if not group.has_error:
+            GROUPS.add(group_name, group.data)
+            return group
+        if group.error_text != "Not found":
+            return group
+        GROUPS.mark_missing(group_name)
+    return Data(GROUPS.suggest(group_name), has_error=True, error="Not found")
 
 
-# @timed_cache(minutes=180)
-async def get_group(group_name: str) -> Data:
+@async_cache(
+    maxsize=2048,
+    cache_if=is_success,
+    on_stale=Data.as_stale,
+    key=without_client,
+    minutes=180,
+)
+async def search_group(client: RuzClient, group_name: str) -> Data:
     """
     Запрашивает группу у сервера
 
+    :param client:
     :param group_name:
     :return: id группы в Data
     """
     try:
-        async with ClientSession() as client:
-            request = await client.get(
-                f"https://ruz.fa.ru/api/search?term={quote(group_name)}&type=group",
-                timeout=2,
-            )
-            found_group = await request.json(loads=loads)
-    except (ClientError, TimeoutError, ValueError):
+        found_group = await client.get_json(
+            "/api/search", params=dict(term=group_name, type="group"), timeout=2,
+        )
+    except (ClientError, TimeoutError, ValueError, CircuitBroken):
         return Data.error("Timeout error")
     if found_group and found_group[0]["label"].strip().upper() == group_name:
         return Data(found_group[0]["id"])
@@ -77,67 +111,224 @@ async def get_group(group_name: str) -> Data:
         return Data.error("Not found")
 
 
-# @timed_cache(minutes=2)
+async def load_directory(client: RuzClient, path: str) -> Data:
+    """
+    Загружает справочник портала
+
+    :param client:
+    :param path: путь справочника, например "/api/dictionary/groups"
+    :return: [(id, название), ...] в Data
+    """
+    try:
+        items = await client.get_json(path, timeout=30)
+    except (ClientError, TimeoutError, ValueError, CircuitBroken):
+        return Data.error("Timeout error")
+    found = []
+    for item in items:
+        label = item.get("label") or item.get("name")
+        if item.get("id") and label:
+            found.append((item["id"], label))
+    return Data(found)
+
+
+async def load_groups(client: RuzClient) -> Data:
+    """
+    Загружает с сервера справочник всех групп в GROUPS
+
+    :param client:
+    :return: количество групп в Data
+    """
+    groups = await load_directory(client, "/api/dictionary/groups")
+    if groups.has_error:
+        return groups
+    GROUPS.load(groups.data)
+    return Data(len(GROUPS))
+
+
+async def load_teachers(client: RuzClient) -> Data:
+    """
+    Загружает с сервера справочник всех преподавателей в TEACHERS
+
+    :param client:
+    :return: количество преподавателей в Data
+    """
+    teachers = await load_directory(client, "/api/dictionary/lecturers")
+    if teachers.has_error:
+        return teachers
+    TEACHERS.load(teachers.data)
+    return Data(len(TEACHERS))
+
+
 async def get_schedule(
-    id: int, date_start: datetime = None, date_end: datetime = None, type: str = "group"
+    client: RuzClient,
+    id: int,
+    date_start: datetime = None,
+    date_end: datetime = None,
+    type: str = "group",
 ) -> Data:
     """
     Запрашивает расписание у сервера
+    :param client:
     :param id:
     :param date_start:
     :param date_end:
     :param type: 'group' 'lecturer'
-    :return: {'dd.mm.yyyy': {'time_start': , 'time_end': , 'name': , 'type': , 'groups': , 'audience': , 'location': ,
-                             'teachers_name': }}
+    :return: {'dd.mm.yyyy': (Lesson, ...)}, см. records.Lesson
     """
 
     if not date_start:
         date_start = datetime.datetime.today()
     if not date_end:
         date_end = datetime.datetime.today() + datetime.timedelta(days=1)
-    url = (
-        f"https://ruz.fa.ru/api/schedule/{type}/{id}?start={date_start.strftime('%Y.%m.%d')}"
-        f"&finish={date_end.strftime('%Y.%m.%d')}&lng=1"
+    days = [
+        date_start.date() + datetime.timedelta(days=i)
+        for i in range((date_end.date() - date_start.date()).days + 1)
+    ]
+    weeks = {week_start(day) for day in days}
+    # Недели запрашиваются целиком, из кэша берутся только нужные дни
+    loaded = await asyncio.gather(
+        *(load_week(client, type, str(id), week) for week in sorted(weeks))
     )
+    for week in loaded:
+        if week.has_error:
+            return week
+    schedule = {}
+    for week in loaded:
+        schedule.update(week.data)
+    res = {}
+    for day in days:
+        text_date = day.strftime("%d.%m.%Y")
+        if text_date in schedule:
+            res[text_date] = schedule[text_date]
+    return Data(res, stale=any(week.stale for week in loaded))
+
+
+async def warm_schedule(client: RuzClient, id: int, type: str = "group") -> bool:
+    """
+    Обновляет в кэше недели, нужные для расписания на сегодня, завтра и эту неделю
+
+    :return: удалось ли обновить
+    """
+    today = datetime.date.today()
+    weeks = {week_start(today), week_start(today + datetime.timedelta(days=1))}
+    loaded = await asyncio.gather(
+        *(load_week.refresh(client, type, str(id), week) for week in sorted(weeks))
+    )
+    return not any(week.has_error for week in loaded)
+
+
+def week_start(date: datetime.date) -> str:
+    """
+    Понедельник недели, в которую входит date, в формате 'yyyy.mm.dd'
+    """
+    return (date - datetime.timedelta(days=date.weekday())).strftime("%Y.%m.%d")
+
+
+def semester_end(date: datetime.date) -> datetime.date:
+    """
+    Последний день семестра (вместе с сессией), в который входит date
+
+    Осенняя сессия проходит в январе, поэтому осенний семестр
+    заканчивается 31 января следующего года
+    """
+    if date.month >= 9:
+        return datetime.date(date.year + 1, 1, 31)
+    if date.month == 1:
+        return datetime.date(date.year, 1, 31)
+    if date.month <= 6:
+        return datetime.date(date.year, 6, 30)
+    return datetime.date(date.year, 8, 31)
+
+
+@async_cache(
+    maxsize=4096,
+    cache_if=is_success,
+    on_stale=Data.as_stale,
+    key=without_client,
+    minutes=2,
+)
+async def load_week(client: RuzClient, type: str, id: str, monday: str) -> Data:
+    """
+    Запрашивает у сервера расписание на неделю, начинающуюся с monday ('yyyy.mm.dd')
+    """
+    start = datetime.datetime.strptime(monday, "%Y.%m.%d")
+    finish = start + datetime.timedelta(days=6)
+    path = f"/api/schedule/{type}/{id}"
+    params = dict(start=monday, finish=finish.strftime("%Y.%m.%d"), lng=1)
+    # Без исполнителя пары разбираются по мере чтения ответа
+    stream = client.executor_mode == "off" and not client.strict_parser
     try:
-        async with ClientSession() as client:
-            request = await client.get(url)
-            request_json = await request.json(loads=loads)
-    except (ClientError, TimeoutError, ValueError):
-        return Data.error("Timeout error")
-    try:
-        res = SCHEDULE_SCHEMA.load({"pairs": request_json})
+        if stream:
+            res = await client.get_json(path, params, parser=ScheduleStreamParser)
+        else:
+            body = await client.get_json(path, params, raw=True)
+            res = await client.run(parse_schedule_body, body, client.strict_parser)
+            if client.executor_mode == "process":
+                # Общие строки и группы дочернего процесса теряются при pickle
+                res = intern_days(res)
         return Data(res)
-    except ValidationError as e:
+    except (ClientError, TimeoutError, CircuitBroken):
+        return Data.error("Timeout error")
+    except (ValidationError, ValueError, KeyError, TypeError, AttributeError) as e:
         log.warning("Validation error in get_schedule for %s %s - %r", type, id, e)
         return Data.error("validation error")
 
 
-# @timed_cache(minutes=180)
-async def get_teacher(teacher_name: str) -> list or None:
+async def get_teacher(client: RuzClient, teacher_name: str) -> Data:
+    """
+    Поиск преподователя в локальном индексе, а если там его нет - на сервере
+
+    :param client:
+    :param teacher_name:
+    :return: [(id, name), ...]
+    """
+    if TEACHERS.loaded:
+        teachers = TEACHERS.search(teacher_name)
+        if teachers:
+            return Data(teachers)
+    teachers = await search_teacher(client, teacher_name)
+    if not teachers.has_error:
+        TEACHERS.add_many(teachers.data)
+    return teachers
+
+
+@async_cache(
+    maxsize=1024,
+    cache_if=is_success,
+    on_stale=Data.as_stale,
+    key=without_client,
+    minutes=180,
+)
+async def search_teacher(client: RuzClient, teacher_name: str) -> Data:
     """
-    Поиск преподователя
+    Поиск преподователя на сервере
 
+    :param client:
     :param teacher_name:
     :return: [(id, name), ...]
     """
     try:
-        async with ClientSession() as client:
-            request = await client.get(
-                f"https://ruz.fa.ru/api/search?term={quote(teacher_name)}&type=person",
-                timeout=2,
-            )
-            request_json = await request.json(loads=loads)
-    except (ClientError, TimeoutError, ValueError):
+        request_json = await client.get_json(
+            "/api/search", params=dict(term=teacher_name, type="person"), timeout=2,
+        )
+    except (ClientError, TimeoutError, ValueError, CircuitBroken):
         return Data.error("Timeout error")
     teachers = [(i["id"], i["label"]) for i in request_json if i["id"]]
     return Data(teachers)
 
 
-async def default_link_formatter(link): return link
+async def default_link_formatter(links: list) -> dict:
+    return {link: link for link in links}
+
+
+# (type, id, 'dd.mm.yyyy', show_groups, show_location, layout)
+#     -> (пары, ссылки, текст)
+# Текст дня верен, пока пары и ссылки этого дня не изменились
+RENDERED_DAYS = AsyncTTLCache(ttl=3600, maxsize=16384, name="render_day")
 
 
 async def format_schedule(
+    client: RuzClient,
     id: int,
     type: str,
     start_day: int = 0,
@@ -145,11 +336,13 @@ async def format_schedule(
     show_groups: bool = False,
     show_location: bool = False,
     text: str = "",
-    link_formatter: callable = default_link_formatter
+    link_formatter: callable = default_link_formatter,
+    layout: str = "default",
 ) -> str or None:
     """
     Форматирует расписание к виду который отправляет бот
 
+    :param client:
     :param show_location:
     :param show_groups:
     :param id:
@@ -157,53 +350,108 @@ async def format_schedule(
     :param text: начальная строка, к которой прибавляется расписание
     :param start_day: начальная дата в количестве дней от сейчас
     :param days: количество дней
-    :param link_formatter: функция для обработки строк с сылками
+    :param link_formatter: корутина [ссылка, ...] -> {ссылка: ссылка для вывода}
+    :param layout: вид сообщения, см. render.LAYOUTS
     :return: строку расписания
     """
     date_start = datetime.datetime.now() + datetime.timedelta(days=start_day)
-    date_end = date_start + datetime.timedelta(days=days)
+    date_end = date_start + datetime.timedelta(days=days - 1)
     schedule = await get_schedule(
-        id, date_start, date_end, type="person" if type == "teacher" else "group"
+        client,
+        id,
+        date_start,
+        date_end,
+        type="person" if type == "teacher" else "group",
     )
     if schedule.has_error:
         return None
-    else:
-        schedule = schedule.data
-    date = datetime.datetime.today()
-    date += datetime.timedelta(days=start_day)
+    urls = {
+        url
+        for lessons in schedule.data.values()
+        for lesson in lessons
+        for url in (lesson.url1, lesson.url2)
+        if url
+    }
+    # Все ссылки сообщения обрабатываются одним вызовом
+    links = await link_formatter(list(urls)) if urls else {}
+    date = date_start.date()
+    fragments = []
+    missing = []
     for _ in range(days):
         text_date = date.strftime("%d.%m.%Y")
-        text += f"📅 {date_name(date)}, {text_date}\n"
-        if text_date in schedule:
-            selected_days = set()
-            for lesson in sorted(schedule[text_date], key=lambda x: x["time_start"]):
-                if lesson["time_start"] in selected_days:
-                    text += "\n"
-                else:
-                    text += f"\n⏱{lesson['time_start']} – {lesson['time_end']}⏱\n"
-                    selected_days.add(lesson["time_start"])
-                text += f"{lesson['name']}\n"
-                if lesson["type"]:
-                    text += f"{lesson['type']}\n"
-                if show_groups and lesson["groups"]:
-                    if lesson["groups"]:
-                        text += "Группы: "
-                        text += f"{', '.join(lesson['groups'])}\n"
-                if lesson["audience"]:
-                    text += f"Где: {lesson['audience']}"
-                if show_location and lesson["location"] is not None:
-                    text += f", {lesson['location']}\n"
-                else:
-                    text += "\n"
-                text += f"Кто: {lesson['teachers_name']}\n"
-                if lesson["note"]:
-                    text += f'Примечание: {lesson["note"]}\n'
-                if lesson["url1"]:
-                    text += lesson['url1_description'] + ": " + await link_formatter(lesson['url1']) + "\n"
-                if lesson["url2"]:
-                    text += lesson['url2_description'] + ": " + await link_formatter(lesson['url2']) + "\n"
+        lessons = schedule.data.get(text_date, ())
+        day_links = {
+            url: links[url]
+            for lesson in lessons
+            for url in (lesson.url1, lesson.url2)
+            if url
+        }
+        key = (type, id, text_date, show_groups, show_location, layout)
+        cached = RENDERED_DAYS.get(key)
+        if cached is not None and cached[:2] == (lessons, day_links):
+            fragments.append(cached[2])
         else:
-            text += f"Нет пар\n"
-        text += "\n"
+            missing.append((len(fragments), key, date, lessons, day_links))
+            fragments.append(None)
         date += datetime.timedelta(days=1)
+    if missing:
+        rendered = await client.run(
+            render_days,
+            [(date, lessons, day_links) for _, _, date, lessons, day_links in missing],
+            show_groups,
+            show_location,
+            layout,
+        )
+        for (index, key, _, lessons, day_links), fragment in zip(missing, rendered):
+            RENDERED_DAYS.set(key, (lessons, day_links, fragment))
+            fragments[index] = fragment
+    text += "".join(fragments)
+    if schedule.stale:
+        text += strings.MAYBE_STALE_SCHEDULE
     return text
+
+
+async def iter_schedule(
+    client: RuzClient,
+    id: int,
+    type: str,
+    start_day: int = 0,
+    days: int = 30,
+    concurrency: int = 4,
+    **kwargs,
+) -> AsyncIterator[Optional[str]]:
+    """
+    Форматирует длинный период по неделям, см. format_schedule
+
+    Недели запрашиваются параллельно, не больше concurrency одновременно,
+    а отдаются по порядку: первая неделя готова, пока грузятся следующие
+
+    :param start_day: начальная дата в количестве дней от сейчас
+    :param days: количество дней
+    :param kwargs: остальные параметры format_schedule
+    :return: строки расписания недель, None если неделю получить не удалось
+    """
+    first_day = datetime.date.today() + datetime.timedelta(days=start_day)
+    chunks = []
+    offset = 0
+    while offset < days:
+        day = first_day + datetime.timedelta(days=offset)
+        chunk_days = min(7 - day.weekday(), days - offset)
+        chunks.append((start_day + offset, chunk_days))
+        offset += chunk_days
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(chunk_start: int, chunk_days: int) -> Optional[str]:
+        async with semaphore:
+            return await format_schedule(
+                client, id, type, start_day=chunk_start, days=chunk_days, **kwargs
+            )
+
+    tasks = [asyncio.ensure_future(load(*chunk)) for chunk in chunks]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -2,17 +2,27 @@ import asyncio
 import logging
 import time
 from asyncio import Event, sleep, TimeoutError
+from collections import OrderedDict
+from hmac import compare_digest
+from typing import Hashable, Optional
 
 import schedule
+from aiomisc import PeriodicCallback
+from aiomisc.service.aiohttp import AIOHTTPService
 from aiomisc.service.base import Service
+from aiomisc.service.periodic import PeriodicService
 from aiovk import TokenSession
 from aiovk.drivers import HttpDriver
-from aiohttp import ClientError
+from aiohttp import ClientError, web
 from ujson import loads, dumps
 
 from app.models import User, UserProxy
 from .dependency import connection
 from .bot import Bot
+from .longpoll import message_from_update
+from .ruz.cache import cache_stats, load_snapshot, save_snapshot
+from .ruz.client import RuzClient
+from .ruz.server import load_groups, load_teachers, warm_schedule
 from .utils import constants as const
 
 log = logging.getLogger(__name__)
@@ -38,42 +48,182 @@ class FixedDriver(HttpDriver):
             log.warning("Vk Timeout error on url %s", url)
             return '{"failed": 2}'
 
-    async def get_text(self, url, params, timeout=None):
-        try:
-            async with self.session.get(url, params=params, timeout=timeout or self.timeout) as response:
-                return response.status, await response.text()
-        except (ClientError, TimeoutError):
-            log.warning("Vk Timeout error on url %s", url)
-            await sleep(5)
-            return await self.get_text(url, params, timeout)
+    async def get_bytes(self, url, params, timeout=None):
+        """
+        GET запрос, повторяемый до успеха
+
+        :return: (статус, тело ответа)
+        """
+        while True:
+            try:
+                async with self.session.get(
+                    url, params=params, timeout=timeout or self.timeout
+                ) as response:
+                    return response.status, await response.read()
+            except (ClientError, TimeoutError):
+                log.warning("Vk Timeout error on url %s", url)
+                await sleep(5)
 
 
 class BotService(Service):
-    __dependencies__ = ("db_write",)
+    __dependencies__ = ("db_write", "ruz_client")
     token: str
     group_id: str
     session: TokenSession
     db_write: connection
+    ruz_client: RuzClient
+    bot: Bot
+    stats_logger: PeriodicCallback
+
+    # Сколько сообщений обрабатывается одновременно и сколько ждет в очереди
+    workers: int = 20
+    queue_size: int = 1000
+    stats_interval: int = 60
+    # При нескольких процессах на непрочитанные отвечает только один
+    answer_unread: bool = True
+    # Сколько секунд при остановке ждать обработки уже принятых сообщений
+    drain_timeout: float = 10
+    stopping: bool = False
 
     async def start(self):
+        await self.start_bot()
+        while not self.stopping:
+            await self.bot.main_loop()
+
+    async def start_bot(self, callback: bool = False):
+        """
+        Создает бота и запускает обработчиков очереди сообщений
+
+        :param callback: сообщения будут приходить через Callback API
+        """
         self.session = TokenSessionFixed(access_token=self.token, driver=FixedDriver())
-        bot = Bot(
-            self.session, group_id=self.group_id, loop=self.loop, db=self.db_write
+        self.bot = Bot(
+            self.session,
+            group_id=self.group_id,
+            loop=self.loop,
+            db=self.db_write,
+            ruz=self.ruz_client,
+            callback=callback,
+            workers=self.workers,
+            queue_size=self.queue_size,
         )
-        self.loop.create_task(bot.vk_bot_answer_unread())
-        while True:
-            await bot.main_loop()
+        self.bot.queue.start()
+        self.stats_logger = PeriodicCallback(self.log_stats)
+        self.stats_logger.start(
+            self.stats_interval, loop=self.loop, delay=self.stats_interval
+        )
+        if self.answer_unread:
+            self.loop.create_task(self.bot.vk_bot_answer_unread())
+
+    async def log_stats(self):
+        log.info("Message queue: %s", self.bot.queue.stats())
+        log.info("RUZ client: %s", self.ruz_client.stats())
+        log.info("RUZ caches: %s", cache_stats())
 
     async def stop(self, exception=None):
+        self.stopping = True
+        await self.stats_logger.stop(return_exceptions=True)
+        # Longpoll ts уже сдвинут, а callback уже получил "ok":
+        # если не дождаться очереди, эти сообщения потеряются
+        try:
+            await asyncio.wait_for(self.bot.queue.join(), self.drain_timeout)
+        except TimeoutError:
+            log.warning(
+                "Message queue was not drained in %s s: %s",
+                self.drain_timeout,
+                self.bot.queue.stats(),
+            )
+        await self.bot.queue.stop()
         await self.session.close()
 
 
+class CallbackBotService(AIOHTTPService, BotService):
+    """
+    Принимает сообщения через VK Callback API вместо longpoll
+
+    Сообщения попадают в ту же очередь бота, ответ ВКонтакте "ok"
+    отправляется сразу, без ожидания места в очереди. Если шард пользователя
+    заполнен, событие не принимается (503) и ВКонтакте пришлет его позже.
+    Повторно присланные уже принятые события отбрасываются
+    """
+
+    __dependencies__ = BotService.__dependencies__
+    path: str = "/callback"
+    # Строка, которую нужно вернуть ВКонтакте при подтверждении адреса сервера
+    confirmation: str
+    # Секретный ключ из настроек Callback API, без него события можно подделать
+    secret: str
+    # Сколько последних принятых событий помнить для отсева повторов
+    seen_size: int = 4096
+    _seen: OrderedDict
+
+    async def create_application(self):
+        application = web.Application()
+        application.router.add_post(self.path, self.handle_event)
+        return application
+
+    async def start(self):
+        self._seen = OrderedDict()
+        await self.start_bot(callback=True)
+        await super().start()
+
+    @staticmethod
+    def event_key(event: dict) -> Optional[Hashable]:
+        """
+        Идентификатор события: event_id, а в старых версиях API - id сообщения
+        """
+        if event.get("event_id"):
+            return event["event_id"]
+        message = event.get("object") or {}
+        message = message.get("message", message)
+        id = message.get("conversation_message_id") or message.get("id")
+        return (message.get("peer_id"), id) if id else None
+
+    async def stop(self, exception=None):
+        await super().stop(exception)
+        await BotService.stop(self, exception)
+
+    async def handle_event(self, request: web.Request) -> web.Response:
+        try:
+            event = await request.json(loads=loads)
+        except ValueError:
+            raise web.HTTPBadRequest()
+        if not isinstance(event, dict):
+            raise web.HTTPBadRequest()
+        if not compare_digest(
+            str(event.get("secret", "")).encode(), self.secret.encode()
+        ):
+            log.warning("Callback event with wrong secret from %s", request.remote)
+            raise web.HTTPForbidden()
+        if str(event.get("group_id")) != str(self.group_id):
+            log.warning("Callback event for group %s", event.get("group_id"))
+            raise web.HTTPForbidden()
+        if event.get("type") == "confirmation":
+            return web.Response(text=self.confirmation)
+        message = message_from_update(event)
+        if message is None:
+            return web.Response(text="ok")
+        key = self.event_key(event)
+        if key is not None and key in self._seen:
+            log.debug("Duplicate callback event %s", key)
+            return web.Response(text="ok")
+        if not self.bot.queue.put_nowait(message):
+            raise web.HTTPServiceUnavailable()
+        if key is not None:
+            self._seen[key] = None
+            if len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+        log.debug('User %s with message "%s"', message.peer_id, message.text)
+        return web.Response(text="ok")
+
+
 class BotSubscriptionService(Service):
-    __dependencies__ = ("db_write",)
+    __dependencies__ = ("db_write", "ruz_client")
     token: str
     bot: Bot
     session: TokenSession
     db_write: connection
+    ruz_client: RuzClient
     exit_event: Event
 
     async def schedule_distribution(self):
@@ -121,7 +271,9 @@ class BotSubscriptionService(Service):
     async def start(self):
         self.exit_event = Event()
         self.session = TokenSessionFixed(access_token=self.token, driver=FixedDriver())
-        self.bot = Bot.without_longpool(self.session, loop=self.loop, db=self.db_write)
+        self.bot = Bot.without_longpool(
+            self.session, loop=self.loop, db=self.db_write, ruz=self.ruz_client
+        )
 
         logging.getLogger("schedule").setLevel(logging.WARNING)
 
@@ -136,3 +288,81 @@ class BotSubscriptionService(Service):
     async def stop(self, exception=None):
         self.exit_event.set()
         await self.session.close()
+
+
+class RuzDirectoryService(PeriodicService):
+    """
+    Загружает при старте и периодически обновляет справочники портала
+    """
+
+    __dependencies__ = ("ruz_client",)
+    ruz_client: RuzClient
+
+    async def callback(self):
+        groups = await load_groups(self.ruz_client)
+        if groups.has_error:
+            log.warning("Can't load groups directory: %s", groups.error_text)
+        else:
+            log.info("Loaded %s groups", groups.data)
+        teachers = await load_teachers(self.ruz_client)
+        if teachers.has_error:
+            log.warning("Can't load teachers directory: %s", teachers.error_text)
+        else:
+            log.info("Loaded %s teachers", teachers.data)
+
+
+class ScheduleWarmupService(PeriodicService):
+    """
+    Заранее обновляет в кэше расписания самых популярных групп и преподавателей,
+    чтобы запросы пользователей не ждали портал после истечения ttl
+    """
+
+    __dependencies__ = ("db_write", "ruz_client")
+    db_write: connection
+    ruz_client: RuzClient
+    size: int
+    concurrency: int = 10
+
+    async def callback(self):
+        async with self.db_write() as conn:
+            popular = await (
+                await conn.execute(User.most_popular(self.size))
+            ).fetchall()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(row):
+            async with semaphore:
+                return await warm_schedule(
+                    self.ruz_client,
+                    row["current_id"],
+                    type="person" if row["role"] == const.ROLE_TEACHER else "group",
+                )
+
+        warmed = await asyncio.gather(*(warm(row) for row in popular))
+        log.debug("Warmed up %s of %s schedules", sum(warmed), len(warmed))
+
+
+class CacheSnapshotService(PeriodicService):
+    """
+    Восстанавливает кэш портала с диска при старте,
+    периодически и при остановке сохраняет его обратно
+
+    С save=False только восстанавливает: при нескольких процессах
+    снимок сохраняет один из них
+    """
+
+    path: str
+    save: bool = True
+
+    async def start(self):
+        log.info("Loaded %s cache entries from %s", load_snapshot(self.path), self.path)
+        if self.save:
+            await super().start()
+
+    async def callback(self):
+        await save_snapshot(self.path)
+
+    async def stop(self, exception=None):
+        if self.save:
+            await super().stop(exception)
+            await save_snapshot(self.path)
@@ -0,0 +1,82 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict
+
+log = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """
+    Запускает несколько рабочих процессов и перезапускает упавшие
+
+    Процессы создаются через fork, поэтому все, что открывает соединения
+    и сокеты, должно создаваться уже внутри target. SIGINT и SIGTERM
+    пересылаются процессам как SIGINT, чтобы они корректно остановили сервисы
+    """
+
+    # Пауза перед перезапуском, чтобы не перезапускать процесс в цикле
+    restart_delay: float = 1
+
+    def __init__(self, target: Callable[[int], None], processes: int) -> None:
+        """
+        :param target: функция процесса, получает номер процесса от 0
+        :param processes: количество процессов
+        """
+        self.target = target
+        self.processes = processes
+        self.context = multiprocessing.get_context("fork")
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.stopping = False
+
+    def run(self) -> None:
+        for index in range(self.processes):
+            self._start_worker(index)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        while self.workers:
+            wait([process.sentinel for process in self.workers.values()])
+            for index, process in list(self.workers.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                del self.workers[index]
+                if self.stopping:
+                    continue
+                log.warning(
+                    "Worker %s (pid %s) exited with code %s, restarting",
+                    index,
+                    process.pid,
+                    process.exitcode,
+                )
+                time.sleep(self.restart_delay)
+                self._start_worker(index)
+        log.info("All workers stopped")
+
+    def _start_worker(self, index: int) -> None:
+        process = self.context.Process(
+            target=self._run_worker, args=(index,), name=f"worker-{index}"
+        )
+        process.start()
+        self.workers[index] = process
+        log.info("Started worker %s (pid %s)", index, process.pid)
+
+    def _run_worker(self, index: int) -> None:
+        # Обработчики сигналов супервизора наследуются при fork
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            self.target(index)
+        except KeyboardInterrupt:
+            pass
+
+    def _stop(self, signum, frame) -> None:
+        log.info("Stopping %s workers", len(self.workers))
+        self.stopping = True
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
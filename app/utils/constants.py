@@ -15,6 +15,7 @@ MENU_SEARCH = "search"
 MENU_SEND_SEARCH = "send_search"
 MENU_SET_TEACHER = "set_teacher"
 MENU_CALENDAR = "calendar_link"
+MENU_SCHEDULE_LONG = "send_long_schedule"
 
 # LEGACY
 MENU_SEARCH_GROUP = "search_group"
@@ -40,6 +41,7 @@ MENUS_LIST = (
     MENU_SEARCH_GROUP,
     MENU_SEND_SEARCH,
     MENU_CALENDAR,
+    MENU_SCHEDULE_LONG,
 )
 
 ROLE_TEACHER = "teacher"
@@ -54,6 +56,9 @@ SUBSCRIPTION_TODAY_TOMORROW = "today_and_tomorrow"
 SUBSCRIPTION_WEEK = "this_week"
 SUBSCRIPTION_NEXT_WEEK = "next_week"
 
+PERIOD_MONTH = "month"
+PERIOD_SEMESTER = "semester"
+
 CHANGES = "CHANGES"
 
 PAYLOAD_FOUND_ID = "found_id"
@@ -65,5 +70,6 @@ PAYLOAD_TYPE = "type"
 PAYLOAD_ROLE = "role"
 PAYLOAD_DATE = "date"
 PAYLOAD_SHOW_INLINE_DATE = "show_inline_date"
+PAYLOAD_PERIOD = "period"
 
 DATE_FORMAT = "%d.%m.%Y"
@@ -1,4 +1,5 @@
-from datetime import datetime, timedelta
+from datetime import date as Date, datetime, timedelta
+from functools import lru_cache
 
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 
@@ -6,7 +7,12 @@ import app.utils.constants as const
 import app.utils.strings as S
 from app.models import UserProxy
 
+# Клавиатуры не меняются между вызовами, поэтому JSON собирается один раз:
+# статичные кэшируются целиком, зависящие от пользователя - по тем полям,
+# которые они читают
 
+
+@lru_cache(maxsize=None)
 def empty_keyboard() -> str:
     """
     Возвращает пустую клавиатуру
@@ -17,6 +23,7 @@ def empty_keyboard() -> str:
     return VkKeyboard().get_empty_keyboard()
 
 
+@lru_cache(maxsize=None)
 def choose_role():
     keyboard = VkKeyboard()
     keyboard.add_button(
@@ -44,7 +51,11 @@ def schedule_menu(user: UserProxy) -> str:
     :param user:
     :return:
     """
+    return _schedule_menu()
+
 
+@lru_cache(maxsize=None)
+def _schedule_menu() -> str:
     keyboard = VkKeyboard()
 
     keyboard.add_button(
@@ -82,6 +93,21 @@ def schedule_menu(user: UserProxy) -> str:
         },
     )
     keyboard.add_line()
+    keyboard.add_button(
+        S.MONTH,
+        payload={
+            const.PAYLOAD_MENU: const.MENU_SCHEDULE_LONG,
+            const.PAYLOAD_PERIOD: const.PERIOD_MONTH,
+        },
+    )
+    keyboard.add_button(
+        S.SEMESTER,
+        payload={
+            const.PAYLOAD_MENU: const.MENU_SCHEDULE_LONG,
+            const.PAYLOAD_PERIOD: const.PERIOD_SEMESTER,
+        },
+    )
+    keyboard.add_line()
     keyboard.add_button(S.SEARCH, payload={const.PAYLOAD_MENU: const.MENU_SEARCH})
     keyboard.add_line()
     keyboard.add_button(S.SETTINGS, payload={const.PAYLOAD_MENU: const.MENU_SETTINGS})
@@ -89,6 +115,7 @@ def schedule_menu(user: UserProxy) -> str:
     return keyboard.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def search_menu() -> str:
     keyboard = VkKeyboard()
     keyboard.add_button(
@@ -127,7 +154,19 @@ def settings_menu(user: UserProxy) -> str:
     :param user:
     :return:
     """
+    return _settings_menu(
+        bool(user.show_groups),
+        bool(user.show_location),
+        user.subscription_days is not None
+        and user.subscription_days != const.CHANGES,
+        bool(user.current_name),
+    )
+
 
+@lru_cache(maxsize=None)
+def _settings_menu(
+    show_groups: bool, show_location: bool, subscribed: bool, has_current_name: bool
+) -> str:
     keyboard = VkKeyboard()
     keyboard.add_button(
         "Изменить информацию о себе",
@@ -136,9 +175,7 @@ def settings_menu(user: UserProxy) -> str:
     keyboard.add_line()
     keyboard.add_button(
         S.SHOW_GROUPS,
-        color=VkKeyboardColor.POSITIVE
-        if user.show_groups
-        else VkKeyboardColor.NEGATIVE,
+        color=VkKeyboardColor.POSITIVE if show_groups else VkKeyboardColor.NEGATIVE,
         payload={
             const.PAYLOAD_MENU: const.MENU_SET_SETTINGS,
             const.PAYLOAD_TYPE: const.SETTINGS_TYPE_GROUPS,
@@ -146,9 +183,7 @@ def settings_menu(user: UserProxy) -> str:
     )
     keyboard.add_button(
         S.SHOW_LOCATION,
-        color=VkKeyboardColor.POSITIVE
-        if user.show_location
-        else VkKeyboardColor.NEGATIVE,
+        color=VkKeyboardColor.POSITIVE if show_location else VkKeyboardColor.NEGATIVE,
         payload={
             const.PAYLOAD_MENU: const.MENU_SET_SETTINGS,
             const.PAYLOAD_TYPE: const.SETTINGS_TYPE_LOCATION,
@@ -156,28 +191,20 @@ def settings_menu(user: UserProxy) -> str:
     )
     keyboard.add_line()
 
-    if (
-        user.subscription_days is None or user.subscription_days == const.CHANGES
-    ) and user.current_name:
+    if not subscribed and has_current_name:
         keyboard.add_button(
             "Подписаться на расписание",
             payload={const.PAYLOAD_MENU: const.MENU_SUBSCRIBE},
         )
-    else:
-        if (
-            user.subscription_days is not None
-            and user.subscription_days != const.CHANGES
-            and user.current_name
-        ):
-            if user.current_name:
-                keyboard.add_button(
-                    "Изменить подписку на расписание",
-                    payload={const.PAYLOAD_MENU: const.MENU_SUBSCRIBE},
-                )
-            keyboard.add_button(
-                "Отписаться от подписки на расписание",
-                payload={const.PAYLOAD_MENU: const.MENU_UNSUBSCRIBE},
-            )
+    elif subscribed and has_current_name:
+        keyboard.add_button(
+            "Изменить подписку на расписание",
+            payload={const.PAYLOAD_MENU: const.MENU_SUBSCRIBE},
+        )
+        keyboard.add_button(
+            "Отписаться от подписки на расписание",
+            payload={const.PAYLOAD_MENU: const.MENU_UNSUBSCRIBE},
+        )
     keyboard.add_line()
     keyboard.add_button(
         S.CALENDAR_LINK, payload={const.PAYLOAD_MENU: const.MENU_CALENDAR},
@@ -199,6 +226,11 @@ def subscribe_to_schedule_start_menu(user: UserProxy) -> str:
     :param user:
     :return:
     """
+    return _subscribe_to_schedule_start_menu()
+
+
+@lru_cache(maxsize=None)
+def _subscribe_to_schedule_start_menu() -> str:
     keyboard = VkKeyboard()
 
     keyboard.add_button("7:00")
@@ -230,6 +262,11 @@ def subscribe_to_schedule_day_menu(user: UserProxy) -> str:
     :param user:
     :return:
     """
+    return _subscribe_to_schedule_day_menu()
+
+
+@lru_cache(maxsize=None)
+def _subscribe_to_schedule_day_menu() -> str:
     keyboard = VkKeyboard()
 
     keyboard.add_button(
@@ -323,7 +360,11 @@ def find_schedule_menu(user: UserProxy) -> str:
     :param user:
     :return:
     """
+    return _find_schedule_menu()
 
+
+@lru_cache(maxsize=None)
+def _find_schedule_menu() -> str:
     keyboard = VkKeyboard()
     keyboard.add_button(
         S.TODAY,
@@ -378,6 +419,7 @@ def find_schedule_menu(user: UserProxy) -> str:
     return keyboard.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def back_to_choosing_role():
     keyboard = VkKeyboard()
     keyboard.add_button(S.BACK, payload={const.PAYLOAD_MENU: const.MENU_CHANGE_GROUP})
@@ -385,6 +427,14 @@ def back_to_choosing_role():
 
 
 def inline_date(date: datetime):
+    # В клавиатуре только дата, время не влияет
+    if isinstance(date, datetime):
+        date = date.date()
+    return _inline_date(date)
+
+
+@lru_cache(maxsize=512)
+def _inline_date(date: Date) -> str:
     keyboard = VkKeyboard(inline=True)
     keyboard.add_button(
         "◀",
@@ -24,6 +24,7 @@ INCORRECT_DATE_FORMAT = (
 )
 CANT_FIND_USER = "Не удалось найти пользователя"
 CANT_GET_SCHEDULE = "Не удалось получить расписание"
+MAYBE_STALE_SCHEDULE = "⚠ Расписание может быть неактуальным"
 TIMEOUT_ERROR = "Не удалось подключиться к сервису расписаний(. Попробуйте позже"
 ERROR = "Ошибка"
 
@@ -33,12 +34,15 @@ GROUP = "Группа «{}»"
 GROUP_NOT_FOUND = (
     "Группа «{}» не существует\n\nПроверьте название группы на http://ruz.fa.ru/ruz"
 )
+MAYBE_GROUP = "Возможно, вы имели в виду: {}"
 FOUND_TEACHER = "Найденный преподаватель: {}"
 
 TODAY = "Сегодня"
 TOMORROW = "Завтра"
 THIS_WEEK = "Эта неделя"
 NEXT_WEEK = "Следующая неделя"
+MONTH = "Месяц"
+SEMESTER = "До конца семестра"
 CANCEL = "Отмена"
 
 STUDENT = "Студент"
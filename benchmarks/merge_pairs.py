@@ -0,0 +1,105 @@
+"""
+Сравнение объединения пар по ключу (PairMerger) с прежним перебором
+списка дня на большом синтетическом расписании потока
+
+    python -m benchmarks.merge_pairs [--groups 30] [--repeat 5]
+"""
+import argparse
+import copy
+import datetime
+import timeit
+
+from app.ruz.parser import parse_pair
+from app.ruz.records import make_lesson
+from app.ruz.schemas import merge_pairs
+
+
+def legacy_merge_pairs(pairs) -> dict:
+    """
+    Прежний ScheduleSchema.post_load: перебор всех пар дня на каждую новую пару
+    """
+    res = dict()
+    for pair in pairs:
+        if pair["date"] in res:
+            for save_pair in res[pair["date"]]:
+                if (
+                    save_pair["time_start"] == pair["time_start"]
+                    and save_pair["name"] == pair["name"]
+                ):
+                    save_pair[
+                        "audience"
+                    ] = f"{save_pair['audience']}, {pair['audience']}"
+                    save_pair["groups"] = save_pair["groups"].union(pair["groups"])
+                    save_pair[
+                        "teachers_name"
+                    ] = f"{save_pair['teachers_name']}, {pair['teachers_name']}"
+                    break
+            else:
+                res[pair["date"]] = res[pair["date"]] + [pair]
+        else:
+            res[pair["date"]] = [pair]
+    return {
+        date: sorted(pairs, key=lambda x: x["time_start"])
+        for date, pairs in res.items()
+    }
+
+
+def stream_schedule(groups: int, weeks: int = 2, lessons: int = 6) -> list:
+    """
+    Расписание потока: каждая пара повторяется у всех групп потока
+    в своей аудитории и со своим преподавателем
+    """
+    times = ("08:30", "10:10", "11:50", "13:30", "15:10", "16:50", "18:30")
+    day = datetime.date(2020, 9, 7)
+    pairs = []
+    for _ in range(weeks * 7):
+        if day.weekday() < 6:
+            for slot in range(lessons):
+                for group in range(groups):
+                    pairs.append(
+                        dict(
+                            beginLesson=times[slot],
+                            endLesson="10:00",
+                            discipline=f"Дисциплина {slot}",
+                            kindOfWork="Лекции",
+                            group=f"ПИ18-{group}",
+                            stream="ПИ18",
+                            auditorium=f"ЛП_51/4/{400 + group}",
+                            building="Ленинградский пр-т, 51",
+                            lecturer=f"Преподаватель {group}",
+                            date=day.strftime("%Y.%m.%d"),
+                            note=None,
+                            url1=None,
+                            url1_description=None,
+                            url2=None,
+                            url2_description=None,
+                        )
+                    )
+        day += datetime.timedelta(days=1)
+    return [parse_pair(pair) for pair in pairs]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pairs = stream_schedule(args.groups)
+    legacy = legacy_merge_pairs(copy.deepcopy(pairs))
+    assert merge_pairs(copy.deepcopy(pairs)) == {
+        date: tuple(make_lesson(pair) for pair in day_pairs)
+        for date, day_pairs in legacy.items()
+    }
+
+    # keyed включает и сборку Lesson, которой у прежнего варианта не было
+    print(f"{len(pairs)} pairs, {args.groups} groups per lesson")
+    for name, merge in (("legacy", legacy_merge_pairs), ("keyed", merge_pairs)):
+        # Пары изменяются при объединении, поэтому каждому прогону своя копия
+        copies = [copy.deepcopy(pairs) for _ in range(args.repeat)]
+        elapsed = timeit.timeit(lambda: merge(copies.pop()), number=args.repeat)
+        print(f"{name:>8}: {elapsed / args.repeat * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Стоимость сборки текста на 1000 недельных расписаний для каждого вида
+из render.LAYOUTS и для прежней сборки через конкатенацию строк
+
+    python -m benchmarks.render [--weeks 1000]
+"""
+import argparse
+import datetime
+import time
+
+from app.ruz.render import DAY_NAMES, LAYOUTS, render_days
+from app.ruz.parser import parse_pair
+from app.ruz.schemas import merge_pairs
+
+LINKS = {
+    "https://zoom.us/j/1": "https://vk.cc/aaaa",
+    "https://zoom.us/j/2": "https://vk.cc/bbbb",
+}
+
+
+def legacy_render_day(date, lessons, show_groups, show_location, links) -> str:
+    """
+    Прежний format_schedule для одного дня
+    """
+    text = f"📅 {DAY_NAMES[date.weekday()]}, {date.strftime('%d.%m.%Y')}\n"
+    if lessons:
+        selected_days = set()
+        for lesson in sorted(lessons, key=lambda x: x.time_start):
+            if lesson.time_start in selected_days:
+                text += "\n"
+            else:
+                text += f"\n⏱{lesson.time_start} – {lesson.time_end}⏱\n"
+                selected_days.add(lesson.time_start)
+            text += f"{lesson.name}\n"
+            if lesson.type:
+                text += f"{lesson.type}\n"
+            if show_groups and lesson.groups:
+                text += f"Группы: {', '.join(lesson.groups)}\n"
+            if lesson.audience:
+                text += f"Где: {lesson.audience}"
+            if show_location and lesson.location is not None:
+                text += f", {lesson.location}\n"
+            else:
+                text += "\n"
+            text += f"Кто: {lesson.teachers_name}\n"
+            if lesson.note:
+                text += f"Примечание: {lesson.note}\n"
+            if lesson.url1:
+                text += f"{lesson.url1_description}: {links[lesson.url1]}\n"
+            if lesson.url2:
+                text += f"{lesson.url2_description}: {links[lesson.url2]}\n"
+    else:
+        text += "Нет пар\n"
+    text += "\n"
+    return text
+
+
+def week_schedule() -> list:
+    """
+    Неделя с 12 парами: две пары в день с понедельника по субботу, воскресенье пустое
+    """
+    monday = datetime.date(2020, 9, 7)
+    pairs = []
+    for offset in range(6):
+        day = monday + datetime.timedelta(days=offset)
+        for slot, time_start in enumerate(("08:30", "10:10")):
+            pairs.append(
+                dict(
+                    beginLesson=time_start,
+                    endLesson="10:00" if slot == 0 else "11:40",
+                    discipline=f"Дисциплина {offset}-{slot}",
+                    kindOfWork="Лекции" if slot == 0 else "Семинар",
+                    group="ПИ18-1, ПИ18-2",
+                    auditorium=f"ЛП_51/4/{401 + slot}",
+                    building="Ленинградский пр-т, 51",
+                    lecturer="Иванов Иван Иванович",
+                    date=day.strftime("%Y.%m.%d"),
+                    note="Дистанционно" if offset == 2 else None,
+                    url1=f"https://zoom.us/j/{slot + 1}",
+                    url1_description="Zoom",
+                )
+            )
+    schedule = merge_pairs(parse_pair(pair) for pair in pairs)
+    return [
+        (day, schedule.get(day.strftime("%d.%m.%Y"), ()), LINKS)
+        for day in (monday + datetime.timedelta(days=offset) for offset in range(7))
+    ]
+
+
+def measure(render, weeks: int) -> float:
+    start = time.perf_counter()
+    for _ in range(weeks):
+        render()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weeks", type=int, default=1000)
+    args = parser.parse_args()
+
+    days = week_schedule()
+    for show_groups in (False, True):
+        for show_location in (False, True):
+            assert render_days(days, show_groups, show_location) == [
+                legacy_render_day(date, lessons, show_groups, show_location, links)
+                for date, lessons, links in days
+            ]
+
+    print(f"{args.weeks} week schedules, groups and location shown")
+    elapsed = measure(
+        lambda: [
+            legacy_render_day(date, lessons, True, True, links)
+            for date, lessons, links in days
+        ],
+        args.weeks,
+    )
+    print(f"{'legacy':>12}: {elapsed:8.1f} ms")
+    for layout in LAYOUTS:
+        elapsed = measure(lambda: render_days(days, True, True, layout), args.weeks)
+        print(f"{layout:>12}: {elapsed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
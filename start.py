@@ -9,8 +9,43 @@ config = dict(
     db_pass=getenv("DB_PASS") or "password",
     db_database=getenv("DB_DATABASE") or "bot",
     db_connect_timeout=int(getenv("DB_TIMEOUT") or "18000"),
+    # Размер пула соединений в каждом процессе
+    db_pool_size=int(getenv("DB_POOL_SIZE") or "50"),
     vk_token=getenv("VK_TOKEN") or "default-token",
     vk_group_id=getenv("GROUP_ID") or "default-group",
+    bot_workers=int(getenv("BOT_WORKERS") or "20"),
+    bot_queue_size=int(getenv("BOT_QUEUE_SIZE") or "1000"),
+    bot_stats_interval=int(getenv("BOT_STATS_INTERVAL") or "60"),
+    bot_drain_timeout=float(getenv("BOT_DRAIN_TIMEOUT") or "10"),
+    # longpoll или callback
+    bot_mode=getenv("BOT_MODE") or "longpoll",
+    callback_host=getenv("CALLBACK_HOST") or "0.0.0.0",
+    callback_port=int(getenv("CALLBACK_PORT") or "8080"),
+    callback_path=getenv("CALLBACK_PATH") or "/callback",
+    # Обязательны в режиме callback
+    vk_confirmation=getenv("VK_CONFIRMATION"),
+    vk_secret=getenv("VK_SECRET"),
+    # Несколько процессов только в режиме callback. Ядро распределяет
+    # соединения между процессами без учета пользователя, поэтому порядок
+    # обработки сообщений одного пользователя сохраняется только внутри процесса
+    bot_processes=int(getenv("BOT_PROCESSES") or "1"),
+    ruz_limit_per_host=int(getenv("RUZ_LIMIT_PER_HOST") or "20"),
+    ruz_dns_ttl=int(getenv("RUZ_DNS_TTL") or "300"),
+    ruz_max_timeout=float(getenv("RUZ_MAX_TIMEOUT") or "10"),
+    ruz_hedge_ratio=float(getenv("RUZ_HEDGE_RATIO") or "0.1"),
+    ruz_strict_parser=getenv("RUZ_STRICT_PARSER") == "True",
+    ruz_executor=getenv("RUZ_EXECUTOR") or "off",
+    ruz_executor_workers=int(getenv("RUZ_EXECUTOR_WORKERS") or "0") or None,
+    ruz_stale_ttl=int(getenv("RUZ_STALE_TTL") or "600"),
+    ruz_grace=int(getenv("RUZ_GRACE") or "21600"),
+    ruz_directory_interval=int(getenv("RUZ_DIRECTORY_INTERVAL") or "21600"),
+    ruz_warmup_interval=int(getenv("RUZ_WARMUP_INTERVAL") or "90"),
+    # Интервал должен быть меньше ttl недели (120 с). Прогревает каждый процесс,
+    # поэтому при BOT_PROCESSES > 1 нагрузку на портал можно снизить размером
+    ruz_warmup_size=int(getenv("RUZ_WARMUP_SIZE") or "300"),
+    # Снимок должен переживать пересоздание контейнера, см. volume в docker-compose
+    ruz_cache_path=getenv("RUZ_CACHE_PATH") or "/var/lib/bot/ruz_cache.pickle.gz",
+    ruz_cache_snapshot_interval=int(getenv("RUZ_CACHE_SNAPSHOT_INTERVAL") or "300"),
     debug=getenv("DEBUG") != "False",
 )
 
@@ -0,0 +1,51 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app.ruz.parser import parse_schedule, parse_schedule_body, ScheduleStreamParser
+
+PAYLOAD = Path(__file__).parent / "fixtures" / "ruz_schedule.json"
+
+
+@pytest.fixture(scope="module")
+def body() -> bytes:
+    return PAYLOAD.read_bytes()
+
+
+@pytest.fixture(scope="module")
+def pairs(body) -> list:
+    return json.loads(body)
+
+
+def stream(body: bytes, size: int) -> dict:
+    parser = ScheduleStreamParser()
+    for start in range(0, len(body), size):
+        parser.feed(body[start : start + size])
+    return parser.close()
+
+
+def test_fast_parser_matches_schema(pairs):
+    assert parse_schedule(pairs) == parse_schedule(pairs, strict=True)
+
+
+def test_body_parser_matches_schema(body, pairs):
+    assert parse_schedule_body(body) == parse_schedule(pairs, strict=True)
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 4096])
+def test_stream_parser_matches_schema(body, pairs, size):
+    assert stream(body, size) == parse_schedule(pairs, strict=True)
+
+
+def test_merged_stream_pair(pairs):
+    lesson = parse_schedule(pairs)["07.09.2020"][0]
+    assert lesson.groups == {"ПИ18-1", "ПИ18-2", "ПИ18-3"}
+    assert lesson.audience == "401, 402, 403"
+    assert lesson.teachers_name == "Лектор 1, Лектор 2, Лектор 3"
+
+
+def test_days_sorted_by_time(pairs):
+    for lessons in parse_schedule(pairs).values():
+        times = [lesson.time_start for lesson in lessons]
+        assert times == sorted(times)